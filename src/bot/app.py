@@ -1,37 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from telegram.ext import ApplicationBuilder, CallbackQueryHandler, CommandHandler, MessageHandler, filters
-from telegram.request import HTTPXRequest
 
 from src.bot.config import load_config
-from src.bot.handlers import (
-    audio_command,
-    beta_request_callback,
-    download_command,
-    format_selection_callback,
-    help_command,
-    start,
-    url_message,
-)
 from src.utils.ytsage_logger import logger
-from src.utils.ytsage_localization import LocalizationManager
+
+
+async def _post_shutdown(application) -> None:
+    from src.bot.handlers import close_file_handles
+
+    await close_file_handles(application)
+    for key in ("dl_executor", "meta_executor"):
+        executor = application.bot_data.pop(key, None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
 
 
 def run() -> None:
+    from telegram.request import HTTPXRequest
+
+    from src.bot.handlers import (
+        BotState,
+        audio_command,
+        beta_request_callback,
+        download_command,
+        format_selection_callback,
+        help_command,
+        start,
+        url_message,
+    )
+    from src.utils.ytsage_localization import LocalizationManager
+
     LocalizationManager.set_language("ru")
     config = load_config()
     if not config.token:
         raise RuntimeError("YTSAGE_BOT_TOKEN is not set")
 
-    request = HTTPXRequest(media_write_timeout=config.telegram_media_write_timeout)
-    application = ApplicationBuilder().token(config.token).request(request).build()
+    request = HTTPXRequest(
+        connection_pool_size=256,
+        pool_timeout=5.0,
+        connect_timeout=10.0,
+        read_timeout=60.0,
+        media_write_timeout=config.telegram_media_write_timeout,
+    )
+    get_updates_request = HTTPXRequest(connection_pool_size=1, connect_timeout=10.0, read_timeout=30.0)
+    application = (
+        ApplicationBuilder()
+        .token(config.token)
+        .request(request)
+        .get_updates_request(get_updates_request)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
     application.bot_data["config"] = config
+    application.bot_data["state"] = BotState(whitelisted_ids=set(config.allowed_chat_ids or ()))
+    application.bot_data["dl_executor"] = ThreadPoolExecutor(
+        max_workers=config.max_concurrent_downloads,
+        thread_name_prefix="ytdl",
+    )
+    application.bot_data["meta_executor"] = ThreadPoolExecutor(
+        max_workers=2 * config.max_concurrent_downloads,
+        thread_name_prefix="ytmeta",
+    )
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("download", download_command))
-    application.add_handler(CommandHandler("audio", audio_command))
-    application.add_handler(CallbackQueryHandler(beta_request_callback, pattern=r"^beta:"))
-    application.add_handler(CallbackQueryHandler(format_selection_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, url_message))
+    application.add_handlers(
+        [
+            CommandHandler("start", start),
+            CommandHandler("help", help_command),
+            CommandHandler("download", download_command),
+            CommandHandler("audio", audio_command),
+            CallbackQueryHandler(beta_request_callback, pattern=r"^beta:"),
+            CallbackQueryHandler(format_selection_callback),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, url_message),
+        ]
+    )
 
     logger.info("Starting Telegram bot polling")
     application.run_polling(drop_pending_updates=True)
@@ -1,24 +1,27 @@
 import os
 import re
+from functools import lru_cache
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Set
+from typing import FrozenSet, Mapping, Optional, Set
 
 from src.utils.ytsage_config_manager import ConfigManager
 from src.utils.ytsage_logger import logger
 
 
+# Single precompiled tokenizer for chat ids: accepts commas and/or whitespace,
+# so env values like "1, 2 3" and one-id-per-line files parse the same way.
 ID_SPLIT_RE = re.compile(r"[,\s]+")
-DEFAULT_WHITELIST_PATH = Path(__file__).resolve().parents[2] / "whitelist.txt"
-DEFAULT_ATTEMPTS_LOG_PATH = Path(__file__).resolve().parents[2] / "attempts.txt"
+_TRUTHY = frozenset({"1", "true", "yes"})
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BotConfig:
     token: str
     download_dir: Path
     max_upload_mb: int
-    allowed_chat_ids: Optional[Set[int]]
+    max_concurrent_downloads: int
+    allowed_chat_ids: Optional[FrozenSet[int]]
     whitelist_path: Path
     attempts_log_path: Path
     cleanup_after_send: bool
@@ -29,6 +32,7 @@ class BotConfig:
     preferred_audio_format: str
     force_output_format: bool
     preferred_output_format: str
+    mp4_format_selector: Optional[str]
     cookie_file: Optional[Path]
     browser_cookies: Optional[str]
     cookie_auto_refresh: bool
@@ -39,8 +43,41 @@ class BotConfig:
     telegram_media_write_timeout: float
 
 
-def _parse_float_env(name: str, default: float) -> float:
-    raw = os.environ.get(name, "").strip()
+def _mp4_format_selector(preferred_output_format: str, default_resolution: str) -> Optional[str]:
+    if preferred_output_format.lower() != "mp4":
+        return None
+    res_value = default_resolution.strip()
+    height_filter = f"[height<={res_value}]" if res_value.isdigit() else ""
+    return f"bestvideo[vcodec~='avc1']{height_filter}+bestaudio[ext=m4a]/best[ext=mp4]/best"
+
+
+def _parse_bool(env: Mapping[str, str], key: str, default: bool) -> bool:
+    raw = env.get(key)
+    if not raw:
+        return default
+    return raw.strip().lower() in _TRUTHY
+
+
+def _env_str(env: Mapping[str, str], name: str, default: Optional[str]) -> Optional[str]:
+    raw = env.get(name)
+    if not raw:
+        return default
+    return raw.strip() or default
+
+
+def _env_int(env: Mapping[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    raw = _env_str(env, name, None)
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"Invalid {name} value; using default {default}")
+        return default
+
+
+def _parse_float_env(env: Mapping[str, str], name: str, default: float) -> float:
+    raw = _env_str(env, name, None)
     if not raw:
         return default
     try:
@@ -63,23 +100,48 @@ def _parse_id_tokens(raw: str, source: str) -> Set[int]:
     return values
 
 
-def _parse_int_set(raw: Optional[str]) -> Optional[Set[int]]:
+def _parse_int_set(raw: Optional[str]) -> Optional[FrozenSet[int]]:
     if not raw:
         return None
     values = _parse_id_tokens(raw, "YTSAGE_ALLOWED_CHAT_IDS")
-    return values or None
+    return frozenset(values) or None
 
 
-def _load_whitelist(path: Path) -> Optional[Set[int]]:
+def _load_whitelist(path: Path) -> Optional[FrozenSet[int]]:
     if not path.exists():
         return None
+    values: Set[int] = set()
     try:
-        raw = path.read_text(encoding="utf-8")
+        with path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    values.add(int(line))
+                except ValueError:
+                    values |= _parse_id_tokens(line, str(path))
     except OSError as exc:
         logger.warning(f"Failed to read whitelist file {path}: {exc}")
         return None
-    values = _parse_id_tokens(raw, str(path))
-    return values or None
+    return frozenset(values) or None
+
+
+@lru_cache(maxsize=1)
+def _project_root() -> Path:
+    return Path(__file__).resolve().parents[2]
+
+
+def _default_whitelist_path() -> Path:
+    return _project_root() / "whitelist.txt"
+
+
+def _default_attempts_log_path() -> Path:
+    return _project_root() / "attempts.txt"
+
+
+def _abs_path(raw: str) -> Path:
+    return Path(os.path.abspath(os.path.expanduser(raw)))
 
 
 def _default_download_dir() -> Path:
@@ -89,70 +151,62 @@ def _default_download_dir() -> Path:
     return Path.home() / "Downloads"
 
 
+@lru_cache(maxsize=1)
 def load_config() -> BotConfig:
-    token = os.environ.get("YTSAGE_BOT_TOKEN", "").strip()
-    download_dir = Path(os.environ.get("YTSAGE_DOWNLOAD_DIR", "").strip() or _default_download_dir())
-    download_dir = download_dir.expanduser().resolve()
-    download_dir.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ)
+    token = _env_str(env, "YTSAGE_BOT_TOKEN", "")
+    download_dir = _abs_path(_env_str(env, "YTSAGE_DOWNLOAD_DIR", None) or str(_default_download_dir()))
 
-    max_upload_mb = int(os.environ.get("YTSAGE_MAX_UPLOAD_MB", "49"))
-    whitelist_path_raw = os.environ.get("YTSAGE_WHITELIST_PATH", "").strip()
+    max_upload_mb = _env_int(env, "YTSAGE_MAX_UPLOAD_MB", 49)
+    max_concurrent_downloads = max(1, _env_int(env, "YTSAGE_MAX_CONCURRENT_DOWNLOADS", 4) or 1)
+    whitelist_path_raw = _env_str(env, "YTSAGE_WHITELIST_PATH", "")
     whitelist_path = (
-        Path(whitelist_path_raw).expanduser().resolve()
+        _abs_path(whitelist_path_raw)
         if whitelist_path_raw
-        else DEFAULT_WHITELIST_PATH
+        else _default_whitelist_path()
     )
-    allowed_chat_ids_env = _parse_int_set(os.environ.get("YTSAGE_ALLOWED_CHAT_IDS"))
+    allowed_chat_ids_env = _parse_int_set(env.get("YTSAGE_ALLOWED_CHAT_IDS"))
     allowed_chat_ids_file = _load_whitelist(whitelist_path)
-    if allowed_chat_ids_env or allowed_chat_ids_file:
-        allowed_chat_ids = set()
-        if allowed_chat_ids_file:
-            allowed_chat_ids |= allowed_chat_ids_file
-        if allowed_chat_ids_env:
-            allowed_chat_ids |= allowed_chat_ids_env
+    if allowed_chat_ids_env and allowed_chat_ids_file:
+        allowed_chat_ids = allowed_chat_ids_file | allowed_chat_ids_env
     else:
-        allowed_chat_ids = None
-    beta_enabled = os.environ.get("YTSAGE_BETA_ENABLED", "false").lower() in {"1", "true", "yes"}
-    admin_chat_id_raw = os.environ.get("YTSAGE_ADMIN_CHAT_ID", "").strip()
-    admin_chat_id: Optional[int] = None
-    if admin_chat_id_raw:
-        try:
-            admin_chat_id = int(admin_chat_id_raw)
-        except ValueError:
-            logger.warning("Invalid YTSAGE_ADMIN_CHAT_ID value; ignoring")
-    attempts_log_path_raw = os.environ.get("YTSAGE_ATTEMPTS_LOG_PATH", "").strip()
+        allowed_chat_ids = allowed_chat_ids_file or allowed_chat_ids_env
+    beta_enabled = _parse_bool(env, "YTSAGE_BETA_ENABLED", False)
+    admin_chat_id = _env_int(env, "YTSAGE_ADMIN_CHAT_ID", None)
+    attempts_log_path_raw = _env_str(env, "YTSAGE_ATTEMPTS_LOG_PATH", "")
     attempts_log_path = (
-        Path(attempts_log_path_raw).expanduser().resolve()
+        _abs_path(attempts_log_path_raw)
         if attempts_log_path_raw
-        else DEFAULT_ATTEMPTS_LOG_PATH
+        else _default_attempts_log_path()
     )
-    cleanup_after_send = os.environ.get("YTSAGE_CLEANUP_AFTER_SEND", "true").lower() in {"1", "true", "yes"}
-
-    default_resolution = os.environ.get("YTSAGE_DEFAULT_RESOLUTION", "720").strip() or "720"
-    force_audio_format = os.environ.get("YTSAGE_FORCE_AUDIO_FORMAT", "false").lower() in {"1", "true", "yes"}
-    preferred_audio_format = os.environ.get("YTSAGE_PREFERRED_AUDIO_FORMAT", "best").strip() or "best"
-    force_output_format = os.environ.get("YTSAGE_FORCE_OUTPUT_FORMAT", "false").lower() in {"1", "true", "yes"}
-    preferred_output_format = os.environ.get("YTSAGE_PREFERRED_OUTPUT_FORMAT", "mp4").strip() or "mp4"
-    cookie_file_raw = os.environ.get("YTSAGE_COOKIE_FILE", "").strip()
-    cookie_file = Path(cookie_file_raw).expanduser().resolve() if cookie_file_raw else None
-    browser_cookies = os.environ.get("YTSAGE_COOKIES_FROM_BROWSER", "").strip() or None
-    cookie_auto_refresh = os.environ.get("YTSAGE_COOKIE_AUTO_REFRESH", "false").lower() in {"1", "true", "yes"}
-    cookie_refresh_command = os.environ.get("YTSAGE_COOKIE_REFRESH_COMMAND", "").strip() or None
-    cookie_refresh_max_age_raw = os.environ.get("YTSAGE_COOKIE_REFRESH_MAX_AGE_HOURS", "").strip()
+    cleanup_after_send = _parse_bool(env, "YTSAGE_CLEANUP_AFTER_SEND", True)
+
+    default_resolution = _env_str(env, "YTSAGE_DEFAULT_RESOLUTION", "720")
+    force_audio_format = _parse_bool(env, "YTSAGE_FORCE_AUDIO_FORMAT", False)
+    preferred_audio_format = _env_str(env, "YTSAGE_PREFERRED_AUDIO_FORMAT", "best")
+    force_output_format = _parse_bool(env, "YTSAGE_FORCE_OUTPUT_FORMAT", False)
+    preferred_output_format = _env_str(env, "YTSAGE_PREFERRED_OUTPUT_FORMAT", "mp4")
+    cookie_file_raw = _env_str(env, "YTSAGE_COOKIE_FILE", "")
+    cookie_file = _abs_path(cookie_file_raw) if cookie_file_raw else None
+    browser_cookies = _env_str(env, "YTSAGE_COOKIES_FROM_BROWSER", None)
+    cookie_auto_refresh = _parse_bool(env, "YTSAGE_COOKIE_AUTO_REFRESH", False)
+    cookie_refresh_command = _env_str(env, "YTSAGE_COOKIE_REFRESH_COMMAND", None)
+    cookie_refresh_max_age_raw = _env_str(env, "YTSAGE_COOKIE_REFRESH_MAX_AGE_HOURS", "")
     cookie_refresh_max_age_seconds: Optional[int] = None
     if cookie_refresh_max_age_raw:
         try:
             cookie_refresh_max_age_seconds = int(float(cookie_refresh_max_age_raw) * 3600)
         except ValueError:
             logger.warning("Invalid YTSAGE_COOKIE_REFRESH_MAX_AGE_HOURS value; ignoring")
-    js_runtime = os.environ.get("YTSAGE_JS_RUNTIME", "").strip() or None
-    auto_setup_deno = os.environ.get("YTSAGE_AUTO_SETUP_DENO", "true").lower() in {"1", "true", "yes"}
-    telegram_media_write_timeout = _parse_float_env("YTSAGE_TELEGRAM_MEDIA_WRITE_TIMEOUT", 120.0)
+    js_runtime = _env_str(env, "YTSAGE_JS_RUNTIME", None)
+    auto_setup_deno = _parse_bool(env, "YTSAGE_AUTO_SETUP_DENO", True)
+    telegram_media_write_timeout = _parse_float_env(env, "YTSAGE_TELEGRAM_MEDIA_WRITE_TIMEOUT", 120.0)
 
     return BotConfig(
         token=token,
         download_dir=download_dir,
         max_upload_mb=max_upload_mb,
+        max_concurrent_downloads=max_concurrent_downloads,
         allowed_chat_ids=allowed_chat_ids,
         whitelist_path=whitelist_path,
         attempts_log_path=attempts_log_path,
@@ -164,6 +218,7 @@ def load_config() -> BotConfig:
         preferred_audio_format=preferred_audio_format,
         force_output_format=force_output_format,
         preferred_output_format=preferred_output_format,
+        mp4_format_selector=_mp4_format_selector(preferred_output_format, default_resolution),
         cookie_file=cookie_file,
         browser_cookies=browser_cookies,
         cookie_auto_refresh=cookie_auto_refresh,
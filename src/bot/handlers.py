@@ -1,30 +1,73 @@
 import asyncio
-import json
+import heapq
+import os
 import re
 import secrets
 import shutil
+import struct
 import subprocess
 import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import urlparse
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Update
+from telegram.error import RetryAfter
 from telegram.ext import ContextTypes
 
 from src.bot.config import BotConfig
-from src.bot.service import FormatOption, list_formats, download_with_callbacks
+from src.bot.service import (
+    TELEGRAM_VIDEO_EXTS,
+    FormatListResult,
+    FormatOption,
+    list_formats,
+    download_with_callbacks,
+)
 from src.utils.ytsage_logger import logger
 from src.core.ytsage_ffmpeg import get_ffmpeg_path
 
 
 URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
+ID_LINE_RE = re.compile(rb"(?m)^[ \t]*(-?\d+)[ \t\r]*$")
+NONBLANK_LINE_RE = re.compile(rb"(?m)^[ \t\r]*\S")
+YT_HOST_RE = re.compile(r"^https?://(?:[\w-]+\.)*(?:youtube\.com|youtu\.be)(?::\d+)?(?:[/?#]|$)", re.IGNORECASE)
 SELECTION_PREFIX = "fmt"
 SELECTION_TTL_SECONDS = 60 * 60
+OPTIONS_CACHE_TTL_SECONDS = 5 * 60
+OPTIONS_CACHE_MAX_ENTRIES = 1024
+PROGRESS_UPDATE_INTERVAL = 1.5
+DEFAULT_PROGRESS_STATUS = "Скачиваю…"
+MP4_MAX_MOOV_BYTES = 32 * 1024 * 1024
+FFMPEG_CONVERT_TIMEOUT_SECONDS = 30 * 60
 BOT_SIGNATURE = "@gruzd_downloader_bot"
-TELEGRAM_VIDEO_EXTS = {"mp4", "m4v", "mov"}
 BETA_REQUEST_PREFIX = "beta"
+FMT_CB_RE = re.compile(rf"^{SELECTION_PREFIX}:([A-Za-z0-9_-]{{6,16}}):(\d+)$")
+BETA_CB_RE = re.compile(rf"^{BETA_REQUEST_PREFIX}:(approve|decline):(-?\d+)$")
+# Searched one category at a time so overlapping keywords can't hide each other.
+ERROR_PATTERNS = {
+    "playlist": re.compile(r"playlist", re.IGNORECASE),
+    "badurl": re.compile(r"invalid url|unsupported url|no video found|invalid", re.IGNORECASE),
+    "auth": re.compile(r"private|login_required|sign in|cookies", re.IGNORECASE),
+    "age": re.compile(r"age restricted|confirm your age", re.IGNORECASE),
+    "geo": re.compile(r"not available in your country|geo[- ]blocked", re.IGNORECASE),
+    "live": re.compile(r"live ?stream|is live", re.IGNORECASE),
+    "net": re.compile(r"timeout|connection|network|unable to download", re.IGNORECASE),
+}
+# Ordered by priority: the first matched category wins, as in the original if-chain.
+ERROR_MESSAGES = {
+    "playlist": "Плейлисты пока не поддерживаются. Пришлите ссылку на конкретное видео.",
+    "badurl": "Не похоже на корректную ссылку YouTube. Проверьте URL и попробуйте снова.",
+    "auth": "Видео требует авторизацию. Попробуйте другое видео или пришлите публичную ссылку.",
+    "age": "Это видео с возрастными ограничениями. Нужен доступ к аккаунту.",
+    "geo": "Видео недоступно в вашем регионе.",
+    "live": "Это прямая трансляция. Попробуйте после окончания эфира.",
+    "net": "Проблемы с сетью. Попробуйте снова чуть позже.",
+}
 WELCOME_MESSAGE = (
     "Привет! Я помогу скачать видео с YouTube.\n\n"
     "Как пользоваться:\n"
@@ -39,17 +82,77 @@ BETA_PENDING_MESSAGE = (
 )
 
 
+class RateLimiter:
+    def __init__(self, rate: float, period: float = 1.0) -> None:
+        self._rate = rate
+        self._period = period
+        self._tokens = rate
+        self._updated = time.monotonic()
+
+    async def __aenter__(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate / self._period)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) * self._period / self._rate)
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+
+# Telegram allows about 30 messages per second per bot; stay under it.
+TELEGRAM_API_LIMITER = RateLimiter(25, 1.0)
+# Resolved ffmpeg/ffprobe paths; misses are not stored so a tool installed later is found.
+_TOOL_PATHS: Dict[str, str] = {}
+
+
 class ProgressReporter:
+    __slots__ = (
+        "_application",
+        "_chat_id",
+        "_message_id",
+        "_loop",
+        "_lock",
+        "_status",
+        "_progress",
+        "_details",
+        "_dirty",
+        "_pending",
+        "_last_text",
+        "_consumer",
+        "_backoff_until",
+    )
+
     def __init__(self, application, chat_id: int, message_id: int, loop: asyncio.AbstractEventLoop) -> None:
         self._application = application
         self._chat_id = chat_id
         self._message_id = message_id
         self._loop = loop
         self._lock = threading.Lock()
-        self._last_send = 0.0
         self._status: Optional[str] = None
         self._progress: Optional[float] = None
         self._details: Optional[str] = None
+        self._dirty = asyncio.Event()
+        self._pending = False
+        self._last_text: Optional[str] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._backoff_until = 0.0
+
+    def start(self) -> None:
+        self._consumer = self._loop.create_task(self._pump())
+
+    async def stop(self) -> None:
+        if self._consumer is None:
+            return
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        self._consumer = None
 
     def status(self, text: str) -> None:
         with self._lock:
@@ -68,77 +171,156 @@ class ProgressReporter:
 
     def _format_text(self) -> str:
         with self._lock:
-            status = self._status or "Скачиваю…"
+            status = self._status or DEFAULT_PROGRESS_STATUS
             progress = self._progress
             details = self._details
-        parts = [status]
-        if progress is not None:
-            parts.append(f"Прогресс: {progress:.1f}%")
+        if progress is None:
+            return f"{status}\n{details}" if details else status
         if details:
-            parts.append(details)
-        return "\n".join(parts)
+            return f"{status}\nПрогресс: {progress:.1f}%\n{details}"
+        return f"{status}\nПрогресс: {progress:.1f}%"
 
     def _schedule_update(self) -> None:
-        now = time.monotonic()
-        if now - self._last_send < 2.0:
+        if time.monotonic() < self._backoff_until:
             return
-        self._last_send = now
-        text = self._format_text()
-        asyncio.run_coroutine_threadsafe(
-            self._application.bot.edit_message_text(
-                chat_id=self._chat_id,
-                message_id=self._message_id,
-                text=text,
-            ),
-            self._loop,
-        )
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self._loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _pump(self) -> None:
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            with self._lock:
+                self._pending = False
+            text = self._format_text()
+            if text != self._last_text:
+                if await self._edit(text):
+                    self._last_text = text
+                else:
+                    self._dirty.set()
+            await asyncio.sleep(max(PROGRESS_UPDATE_INTERVAL, self._backoff_until - time.monotonic()))
+
+    async def _edit(self, text: str) -> bool:
+        try:
+            async with TELEGRAM_API_LIMITER:
+                await self._application.bot.edit_message_text(
+                    chat_id=self._chat_id,
+                    message_id=self._message_id,
+                    text=text,
+                )
+        except RetryAfter as exc:
+            self._backoff_until = time.monotonic() + _retry_after_seconds(exc) + 0.1
+            return False
+        except Exception as exc:
+            logger.debug("Failed to update progress message: {}", exc)
+        return True
+
+    async def _force_edit(self, text: str) -> None:
+        if text == self._last_text:
+            return
+        for _ in range(2):
+            wait = self._backoff_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if await self._edit(text):
+                self._last_text = text
+                return
 
     def force_update(self, text: str) -> None:
-        asyncio.run_coroutine_threadsafe(
-            self._application.bot.edit_message_text(
-                chat_id=self._chat_id,
-                message_id=self._message_id,
-                text=text,
-            ),
-            self._loop,
-        )
+        asyncio.run_coroutine_threadsafe(self._force_edit(text), self._loop)
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    retry_after = exc.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+@dataclass
+class BotState:
+    attempts_seen: Set[int] = field(default_factory=set)
+    attempts_loaded: bool = False
+    runtime_allowed_ids: Set[int] = field(default_factory=set)
+    whitelisted_ids: Set[int] = field(default_factory=set)
+    format_selections: Dict[str, dict] = field(default_factory=dict)
+    format_selections_heap: List[Tuple[float, str]] = field(default_factory=list)
+    file_handles: Dict[Path, TextIO] = field(default_factory=dict)
+    download_dir_ready: bool = False
+    bg_tasks: Set[asyncio.Task] = field(default_factory=set)
+    options_cache: OrderedDict[str, Tuple[float, FormatListResult]] = field(default_factory=OrderedDict)
 
 
 def _get_config(context: ContextTypes.DEFAULT_TYPE) -> BotConfig:
     return context.application.bot_data["config"]
 
 
-def _attempts_state(context: ContextTypes.DEFAULT_TYPE) -> Dict[str, object]:
-    state = context.application.bot_data.setdefault("attempts_state", {"seen": set(), "loaded": False})
-    if not isinstance(state, dict):
-        state = {"seen": set(), "loaded": False}
-        context.application.bot_data["attempts_state"] = state
-    if "seen" not in state or not isinstance(state.get("seen"), set):
-        state["seen"] = set()
-    if "loaded" not in state:
-        state["loaded"] = False
-    return state
+def _state(context: ContextTypes.DEFAULT_TYPE) -> BotState:
+    return context.application.bot_data["state"]
+
+
+async def _run_in_executor(context: ContextTypes.DEFAULT_TYPE, executor_key: str, func, *args):
+    executor = context.application.bot_data.get(executor_key)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+
+def _ensure_download_dir(context: ContextTypes.DEFAULT_TYPE, config: BotConfig) -> None:
+    state = _state(context)
+    if state.download_dir_ready:
+        return
+    try:
+        config.download_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        logger.warning("Failed to create download directory {}: {}", config.download_dir, exc)
+        return
+    state.download_dir_ready = True
+
+
+def _get_appender(context: ContextTypes.DEFAULT_TYPE, path: Path) -> TextIO:
+    handles = _state(context).file_handles
+    handle = handles.get(path)
+    if handle is None or handle.closed:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle = path.open("a", encoding="utf-8", buffering=8192)
+        handles[path] = handle
+    return handle
 
 
-def _load_attempts_once(state: Dict[str, object], path: Path) -> None:
-    if state.get("loaded"):
+async def close_file_handles(application) -> None:
+    state: Optional[BotState] = application.bot_data.get("state")
+    if state is None:
         return
-    state["loaded"] = True
+    handles, state.file_handles = state.file_handles, {}
+    for path, handle in handles.items():
+        try:
+            handle.close()
+        except OSError as exc:
+            logger.warning("Failed to close {}: {}", path, exc)
+
+
+def _load_attempts_once(state: BotState, path: Path) -> None:
+    if state.attempts_loaded:
+        return
+    state.attempts_loaded = True
     if not path.exists():
         return
     try:
-        for line in path.read_text(encoding="utf-8").splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                seen_ids = state.get("seen")
-                if isinstance(seen_ids, set):
-                    seen_ids.add(int(line))
-            except ValueError:
-                logger.warning(f"Invalid attempt id in {path}: {line}")
+        data = path.read_bytes()
     except OSError as exc:
-        logger.warning(f"Failed to read attempts file {path}: {exc}")
+        logger.warning("Failed to read attempts file {}: {}", path, exc)
+        return
+    ids = ID_LINE_RE.findall(data)
+    state.attempts_seen.update(map(int, ids))
+    if len(ids) != len(NONBLANK_LINE_RE.findall(data)):
+        # Rare path: walk the lines only to name the ones that are not plain ids.
+        for line in data.splitlines():
+            line = line.strip()
+            if line and not ID_LINE_RE.match(line):
+                logger.warning("Invalid attempt id in {}: {}", path, line.decode(errors="replace"))
 
 
 def _record_attempt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -150,40 +332,28 @@ def _record_attempt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     if attempt_id is None:
         return False
 
-    state = _attempts_state(context)
+    state = _state(context)
     _load_attempts_once(state, attempts_path)
-    seen_ids = state.get("seen")
-    if not isinstance(seen_ids, set):
-        seen_ids = set()
-        state["seen"] = seen_ids
-    if attempt_id in seen_ids:
+    if attempt_id in state.attempts_seen:
         return False
 
     try:
-        attempts_path.parent.mkdir(parents=True, exist_ok=True)
-        with attempts_path.open("a", encoding="utf-8") as handle:
-            handle.write(f"{attempt_id}\n")
+        handle = _get_appender(context, attempts_path)
+        handle.write(f"{attempt_id}\n")
+        handle.flush()
     except OSError as exc:
-        logger.warning(f"Failed to write attempts file {attempts_path}: {exc}")
+        logger.warning("Failed to write attempts file {}: {}", attempts_path, exc)
         return False
 
-    seen_ids.add(attempt_id)
+    state.attempts_seen.add(attempt_id)
     return True
 
 
-def _runtime_allowed_ids(context: ContextTypes.DEFAULT_TYPE) -> set:
-    store = context.application.bot_data.setdefault("runtime_allowed_ids", set())
-    if not isinstance(store, set):
-        store = set()
-        context.application.bot_data["runtime_allowed_ids"] = store
-    return store
-
-
 def _combined_allowed_ids(context: ContextTypes.DEFAULT_TYPE, config: BotConfig) -> set:
     combined = set()
     if config.allowed_chat_ids:
         combined |= config.allowed_chat_ids
-    combined |= _runtime_allowed_ids(context)
+    combined |= _state(context).runtime_allowed_ids
     return combined
 
 
@@ -208,27 +378,20 @@ def _is_allowed(update: Update, context: ContextTypes.DEFAULT_TYPE, config: BotC
     return (user_id in allowed_ids) or (chat_id in allowed_ids)
 
 
-def _append_to_whitelist(path: Path, user_id: int) -> bool:
-    try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        existing = set()
-        if path.exists():
-            for line in path.read_text(encoding="utf-8").splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    existing.add(int(line))
-                except ValueError:
-                    continue
-        if user_id in existing:
-            return True
-        with path.open("a", encoding="utf-8") as handle:
-            handle.write(f"{user_id}\n")
+def _append_to_whitelist(context: ContextTypes.DEFAULT_TYPE, config: BotConfig, user_id: int) -> bool:
+    existing = _state(context).whitelisted_ids
+    if user_id in existing:
         return True
+    path = config.whitelist_path
+    try:
+        handle = _get_appender(context, path)
+        handle.write(f"{user_id}\n")
+        handle.flush()
     except OSError as exc:
-        logger.warning(f"Failed to update whitelist file {path}: {exc}")
+        logger.warning("Failed to update whitelist file {}: {}", path, exc)
         return False
+    existing.add(user_id)
+    return True
 
 
 def _build_beta_keyboard(user_id: int) -> InlineKeyboardMarkup:
@@ -284,38 +447,132 @@ def _extract_url(text: Optional[str]) -> Optional[str]:
     return match.group(0) if match else None
 
 
+def _command_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    args = context.args
+    url = None
+    if args:
+        url = _extract_url(args[0] if len(args) == 1 else " ".join(args))
+    return url or _extract_url(update.message.text)
+
+
 def _is_youtube_url(url: str) -> bool:
-    try:
-        parsed = urlparse(url)
-    except Exception:
-        return False
-    host = (parsed.netloc or "").lower()
-    if not host:
-        return False
-    return host.endswith("youtube.com") or host.endswith("youtu.be")
+    return bool(YT_HOST_RE.match(url))
 
 
-def _file_too_large(path: Path, config: BotConfig) -> bool:
-    max_bytes = config.max_upload_mb * 1024 * 1024
-    try:
-        return path.stat().st_size > max_bytes
-    except OSError:
-        return True
+def _check_size(stat: Optional[os.stat_result], config: BotConfig) -> Tuple[Optional[int], bool]:
+    if stat is None:
+        return None, True
+    size = stat.st_size
+    return size, size > config.max_upload_mb * 1024 * 1024
+
+
+def _too_large_message(size: Optional[int]) -> str:
+    if size is None:
+        return "Не удалось проверить размер файла для загрузки в Telegram."
+    return f"Файл слишком большой для загрузки в Telegram ({size / (1024 * 1024):.1f} MB)."
 
 
 def _get_ffprobe_path() -> Optional[str]:
+    cached = _TOOL_PATHS.get("ffprobe")
+    if cached:
+        return cached
     ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        ffmpeg_path = get_ffmpeg_path()
+        if isinstance(ffmpeg_path, Path):
+            candidate = ffmpeg_path.parent / "ffprobe"
+            if candidate.exists():
+                ffprobe = str(candidate)
     if ffprobe:
-        return ffprobe
-    ffmpeg_path = get_ffmpeg_path()
-    if isinstance(ffmpeg_path, Path):
-        candidate = ffmpeg_path.parent / "ffprobe"
-        if candidate.exists():
-            return str(candidate)
+        _TOOL_PATHS["ffprobe"] = ffprobe
+    return ffprobe
+
+
+def _iter_mp4_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_mp4_moov(handle: BinaryIO) -> Optional[bytes]:
+    handle.seek(0, 2)
+    file_size = handle.tell()
+    offset = 0
+    while offset + 8 <= file_size:
+        handle.seek(offset)
+        header = handle.read(16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1 and len(header) >= 16:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            return None
+        if box_type == b"moov":
+            if size > MP4_MAX_MOOV_BYTES:
+                return None
+            handle.seek(offset + header_size)
+            return handle.read(size - header_size)
+        offset += size
+    return None
+
+
+def _read_mp4_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        with path.open("rb") as handle:
+            moov = _find_mp4_moov(handle)
+    except OSError:
+        return None
+    if not moov:
+        return None
+    try:
+        for box_type, trak_start, trak_end in _iter_mp4_boxes(moov, 0, len(moov)):
+            if box_type != b"trak":
+                continue
+            for child_type, tkhd_start, tkhd_end in _iter_mp4_boxes(moov, trak_start, trak_end):
+                if child_type != b"tkhd":
+                    continue
+                version = moov[tkhd_start]
+                dims_offset = tkhd_start + (88 if version == 1 else 76)
+                if dims_offset + 8 > tkhd_end:
+                    break
+                width, height = struct.unpack_from(">II", moov, dims_offset)
+                width >>= 16
+                height >>= 16
+                if width and height:
+                    return width, height
+                break
+    except struct.error:
+        return None
     return None
 
 
 def _probe_video_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return _probe_cached(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=128)
+def _probe_cached(path_str: str, size: int, mtime_ns: int) -> Optional[Tuple[int, int]]:
     ffprobe = _get_ffprobe_path()
     if not ffprobe:
         return None
@@ -328,81 +585,128 @@ def _probe_video_dimensions(path: Path) -> Optional[Tuple[int, int]]:
         "-show_entries",
         "stream=width,height",
         "-of",
-        "json",
-        str(path),
+        "csv=s=x:p=0",
+        path_str,
     ]
     try:
         result = subprocess.run(cmd, capture_output=True, text=True, check=False)
         if result.returncode != 0:
             return None
-        data = json.loads(result.stdout or "{}")
-        streams = data.get("streams", [])
-        if not streams:
+        first_line = (result.stdout or "").strip().partition("\n")[0]
+        if not first_line:
             return None
-        width = streams[0].get("width")
-        height = streams[0].get("height")
-        if isinstance(width, int) and isinstance(height, int):
-            return width, height
+        width, _, height = first_line.partition("x")
+        return int(width), int(height)
+    except ValueError:
         return None
     except Exception:
         logger.exception("Failed to probe video dimensions")
         return None
 
 
+async def _send_media(send, field: str, media: Path, filename: str, **kwargs) -> None:
+    for attempt in range(2):
+        with _upload_source(media, filename) as upload:
+            try:
+                async with TELEGRAM_API_LIMITER:
+                    await send(**{field: upload}, **kwargs)
+                return
+            except RetryAfter as exc:
+                if attempt:
+                    raise
+                delay = _retry_after_seconds(exc)
+        await asyncio.sleep(delay)
+
+
+@contextmanager
+def _upload_source(media: Path, filename: str) -> Iterator[InputFile]:
+    with media.open("rb") as handle:
+        yield InputFile(handle, filename=filename, read_file_handle=False)
+
+
+def _known_video_dimensions(width: Optional[int], height: Optional[int]) -> Optional[Tuple[int, int]]:
+    if isinstance(width, int) and isinstance(height, int) and width > 0 and height > 0:
+        return width, height
+    return None
+
+
 def _resolve_ffmpeg_path() -> Optional[str]:
+    cached = _TOOL_PATHS.get("ffmpeg")
+    if cached:
+        return cached
     ffmpeg_path = get_ffmpeg_path()
     if isinstance(ffmpeg_path, Path):
-        return str(ffmpeg_path) if ffmpeg_path.exists() else None
-    resolved = shutil.which(str(ffmpeg_path))
-    return resolved if resolved else None
+        resolved = str(ffmpeg_path) if ffmpeg_path.exists() else None
+    else:
+        resolved = shutil.which(str(ffmpeg_path))
+    if resolved:
+        _TOOL_PATHS["ffmpeg"] = resolved
+    return resolved
+
+
+def _run_ffmpeg(cmd: List[str]) -> Tuple[bool, str]:
+    # communicate() drains stderr so a chatty ffmpeg can't block on a full pipe.
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        _, stderr = proc.communicate(timeout=FFMPEG_CONVERT_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        return False, f"timed out after {FFMPEG_CONVERT_TIMEOUT_SECONDS}s"
+    return proc.returncode == 0, stderr.decode(errors="replace").strip()
 
 
-def _is_telegram_video_ext(path: Path, option: Optional[dict]) -> bool:
-    ext = ""
-    if option:
-        ext = (option.get("ext") or "").strip().lower()
-    if not ext:
-        ext = path.suffix.lstrip(".").lower()
-    return ext in TELEGRAM_VIDEO_EXTS
+def _probe_stream_codecs(path: Path) -> Tuple[Optional[str], Optional[str]]:
+    # Codec names of the first video and audio streams; None when absent or ffprobe is unavailable.
+    ffprobe = _get_ffprobe_path()
+    if not ffprobe:
+        return None, None
+    cmd = [ffprobe, "-v", "error", "-show_entries", "stream=codec_type,codec_name", "-of", "compact=p=0", str(path)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=False, timeout=30)
+    except Exception as exc:
+        logger.warning("ffprobe codec check failed: {}", exc)
+        return None, None
+    codecs: Dict[str, str] = {}
+    for line in result.stdout.splitlines():
+        fields = dict(item.partition("=")[::2] for item in line.split("|"))
+        codecs.setdefault(fields.get("codec_type", ""), fields.get("codec_name", ""))
+    return codecs.get("video"), codecs.get("audio")
+
 
+def _can_stream_copy(path: Path) -> bool:
+    # Stream copy only helps when the codecs already play inline in Telegram (H.264 with AAC/MP3 or no audio).
+    video_codec, audio_codec = _probe_stream_codecs(path)
+    return video_codec == "h264" and audio_codec in (None, "aac", "mp3")
 
-def _convert_to_mp4_for_telegram(path: Path, reporter: ProgressReporter) -> Optional[Path]:
+
+def _convert_to_mp4_for_telegram(
+    path: Path, reporter: ProgressReporter, max_bytes: int
+) -> Tuple[Optional[Path], bool]:
     ffmpeg = _resolve_ffmpeg_path()
     if not ffmpeg:
-        return None
-    target = path.with_suffix(".mp4")
-    if target == path:
-        return target
-    if target.exists():
-        target = path.with_name(f"{path.stem}_tg.mp4")
+        return None, False
+    target = path.with_name(f"{path.stem}_tg.mp4")
     reporter.force_update("Конвертирую в MP4 для Telegram…")
-    cmd = [
-        ffmpeg,
-        "-y",
-        "-i",
-        str(path),
-        "-c:v",
-        "libx264",
-        "-preset",
-        "veryfast",
-        "-pix_fmt",
-        "yuv420p",
-        "-c:a",
-        "aac",
-        "-movflags",
-        "+faststart",
-        str(target),
-    ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            logger.warning(f"FFmpeg conversion failed: {result.stderr.strip()}")
-            return None
-        if target.exists():
-            return target
-    except Exception as exc:
-        logger.warning(f"FFmpeg conversion error: {exc}")
-    return None
+    base = [ffmpeg, "-y", "-v", "error", "-i", str(path)]
+    output = ["-movflags", "+faststart", str(target)]
+    encode = ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-c:a", "aac"]
+    attempts = (["-c", "copy"], encode) if _can_stream_copy(path) else (encode,)
+    for codec_args in attempts:
+        try:
+            ok, error = _run_ffmpeg(base + codec_args + output)
+            if ok and target.stat().st_size > max_bytes:
+                target.unlink(missing_ok=True)
+                return None, True
+        except Exception as exc:
+            logger.warning("FFmpeg conversion error: {}", exc)
+            target.unlink(missing_ok=True)
+            return None, False
+        if ok:
+            return target, False
+        target.unlink(missing_ok=True)
+        logger.warning("FFmpeg conversion failed ({}): {}", codec_args[1], error)
+    return None, False
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -417,7 +721,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             disable_notification=True,
         )
     except Exception as exc:
-        logger.info(f"Could not pin welcome message: {exc}")
+        logger.info("Could not pin welcome message: {}", exc)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -428,7 +732,7 @@ async def download_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     config = _get_config(context)
     if not await _ensure_allowed(update, context, config):
         return
-    url = _extract_url(" ".join(context.args)) or _extract_url(update.message.text)
+    url = _command_url(update, context)
     if not url:
         await update.message.reply_text("Пришлите ссылку на YouTube.")
         return
@@ -439,7 +743,7 @@ async def audio_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     config = _get_config(context)
     if not await _ensure_allowed(update, context, config):
         return
-    url = _extract_url(" ".join(context.args)) or _extract_url(update.message.text)
+    url = _command_url(update, context)
     if not url:
         await update.message.reply_text("Пришлите ссылку на YouTube.")
         return
@@ -456,19 +760,32 @@ async def url_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await _handle_url(update, context, url)
 
 
-def _selection_store(context: ContextTypes.DEFAULT_TYPE) -> Dict[str, dict]:
-    store = context.application.bot_data.setdefault("format_selections", {})
-    if not isinstance(store, dict):
-        store = {}
-        context.application.bot_data["format_selections"] = store
-    return store
+def _cleanup_selections(store: Dict[str, dict], heap: List[Tuple[float, str]]) -> None:
+    now = time.time()
+    while heap and heap[0][0] < now:
+        _, selection_id = heapq.heappop(heap)
+        store.pop(selection_id, None)
 
 
-def _cleanup_selections(store: Dict[str, dict]) -> None:
-    now = time.time()
-    expired = [key for key, item in store.items() if now - item.get("created_at", now) > SELECTION_TTL_SECONDS]
-    for key in expired:
-        store.pop(key, None)
+def _cached_format_list(state: BotState, url: str) -> Optional[FormatListResult]:
+    cache = state.options_cache
+    entry = cache.get(url)
+    if entry is None:
+        return None
+    expires_at, result = entry
+    if expires_at < time.monotonic():
+        del cache[url]
+        return None
+    cache.move_to_end(url)
+    return result
+
+
+def _cache_format_list(state: BotState, url: str, result: FormatListResult) -> None:
+    cache = state.options_cache
+    cache[url] = (time.monotonic() + OPTIONS_CACHE_TTL_SECONDS, result)
+    cache.move_to_end(url)
+    while len(cache) > OPTIONS_CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
 
 
 def _human_size(value: Optional[int]) -> Optional[str]:
@@ -483,21 +800,9 @@ def _human_size(value: Optional[int]) -> Optional[str]:
 
 
 def _format_error_for_user(error_text: str) -> str:
-    normalized = (error_text or "").lower()
-    if "playlist" in normalized:
-        return "Плейлисты пока не поддерживаются. Пришлите ссылку на конкретное видео."
-    if any(marker in normalized for marker in ["invalid url", "unsupported url", "no video found", "invalid"]):
-        return "Не похоже на корректную ссылку YouTube. Проверьте URL и попробуйте снова."
-    if any(marker in normalized for marker in ["private", "login_required", "sign in", "cookies"]):
-        return "Видео требует авторизацию. Попробуйте другое видео или пришлите публичную ссылку."
-    if any(marker in normalized for marker in ["age restricted", "confirm your age"]):
-        return "Это видео с возрастными ограничениями. Нужен доступ к аккаунту."
-    if any(marker in normalized for marker in ["not available in your country", "geo-blocked", "geo blocked"]):
-        return "Видео недоступно в вашем регионе."
-    if any(marker in normalized for marker in ["live stream", "livestream", "is live"]):
-        return "Это прямая трансляция. Попробуйте после окончания эфира."
-    if any(marker in normalized for marker in ["timeout", "connection", "network", "unable to download"]):
-        return "Проблемы с сетью. Попробуйте снова чуть позже."
+    for key, message in ERROR_MESSAGES.items():
+        if ERROR_PATTERNS[key].search(error_text or ""):
+            return message
     return "Не удалось обработать ссылку. Проверьте, что видео доступно, и попробуйте снова."
 
 
@@ -521,28 +826,35 @@ async def _handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE, url: s
         return
     status_message = await update.message.reply_text("Проверяю ссылку и доступные качества…")
 
-    result = await asyncio.to_thread(list_formats, url, _get_config(context))
-    if not result.ok:
-        logger.error(f"Format listing failed for {url}: {result.error}")
-        await status_message.edit_text(_format_error_for_user(result.error or "Unknown error"))
-        return
+    state = _state(context)
+    result = _cached_format_list(state, url)
+    if result is None:
+        result = await _run_in_executor(context, "meta_executor", list_formats, url, _get_config(context))
+        if not result.ok:
+            logger.error("Format listing failed for {}: {}", url, result.error)
+            await status_message.edit_text(_format_error_for_user(result.error or "Unknown error"))
+            return
+        _cache_format_list(state, url, result)
 
     options = result.options
     if not options:
         await status_message.edit_text("Не удалось получить варианты качества. Попробуйте другую ссылку.")
         return
 
-    store = _selection_store(context)
-    _cleanup_selections(store)
+    store = state.format_selections
+    heap = state.format_selections_heap
+    _cleanup_selections(store, heap)
     selection_id = secrets.token_urlsafe(8)
+    created_at = time.time()
     store[selection_id] = {
         "url": url,
-        "options": [option.__dict__ for option in options],
+        "options": options,
         "owner_id": update.effective_user.id if update.effective_user else None,
         "chat_id": chat_id,
         "message_id": status_message.message_id,
-        "created_at": time.time(),
+        "created_at": created_at,
     }
+    heapq.heappush(heap, (created_at + SELECTION_TTL_SECONDS, selection_id))
 
     title_line = f"Видео: {result.title}" if result.title else "Видео найдено"
     duration_line = f"Длительность: {result.duration}" if result.duration else None
@@ -561,8 +873,9 @@ async def beta_request_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     if not query or not query.data:
         return
-    parts = query.data.split(":")
-    if len(parts) != 3 or parts[0] != BETA_REQUEST_PREFIX:
+    match = BETA_CB_RE.match(query.data)
+    if not match:
+        await query.answer()
         return
     config = _get_config(context)
     if not config.beta_enabled:
@@ -571,32 +884,21 @@ async def beta_request_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if not _is_admin(update, config):
         await query.answer("Недостаточно прав.", show_alert=True)
         return
-    action = parts[1]
-    try:
-        user_id = int(parts[2])
-    except ValueError:
-        await query.answer("Некорректный ID.", show_alert=True)
-        return
+    action, user_id = match.group(1), int(match.group(2))
 
     if action == "approve":
-        _runtime_allowed_ids(context).add(user_id)
-        if config.allowed_chat_ids is not None:
-            config.allowed_chat_ids.add(user_id)
-        _append_to_whitelist(config.whitelist_path, user_id)
+        _state(context).runtime_allowed_ids.add(user_id)
+        _append_to_whitelist(context, config, user_id)
         try:
             await context.bot.send_message(chat_id=user_id, text=WELCOME_MESSAGE)
         except Exception as exc:
-            logger.info(f"Failed to send welcome to approved user {user_id}: {exc}")
+            logger.info("Failed to send welcome to approved user {}: {}", user_id, exc)
         await query.answer("Доступ выдан.")
         await query.edit_message_text(f"✅ Доступ выдан пользователю {user_id}.")
         return
 
-    if action == "decline":
-        await query.answer("Отклонено.")
-        await query.edit_message_text(f"❌ Заявка отклонена для пользователя {user_id}.")
-        return
-
-    await query.answer()
+    await query.answer("Отклонено.")
+    await query.edit_message_text(f"❌ Заявка отклонена для пользователя {user_id}.")
 
 
 async def format_selection_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -610,20 +912,15 @@ async def format_selection_callback(update: Update, context: ContextTypes.DEFAUL
         await query.answer("Доступ к боту ограничен.", show_alert=True)
         return
 
-    parts = query.data.split(":")
-    if len(parts) != 3 or parts[0] != SELECTION_PREFIX:
-        return
-
-    selection_id = parts[1]
-    try:
-        idx = int(parts[2])
-    except ValueError:
+    match = FMT_CB_RE.match(query.data)
+    if not match:
         await query.answer()
-        await query.edit_message_text("Не удалось обработать выбор. Попробуйте снова.")
         return
+    selection_id, idx = match.group(1), int(match.group(2))
 
-    store = _selection_store(context)
-    _cleanup_selections(store)
+    state = _state(context)
+    store = state.format_selections
+    _cleanup_selections(store, state.format_selections_heap)
     payload = store.get(selection_id)
     if not payload:
         await query.answer()
@@ -644,8 +941,8 @@ async def format_selection_callback(update: Update, context: ContextTypes.DEFAUL
     option = options[idx]
     store.pop(selection_id, None)
 
-    option_label = option.get("quality_label") or option.get("label") or "Выбранное качество"
-    size_hint = _human_size(option.get("filesize"))
+    option_label = option.quality_label or option.label or "Выбранное качество"
+    size_hint = _human_size(option.filesize)
     eta_hint = f"Оценка размера: {size_hint}." if size_hint else None
 
     status_lines = [f"Скачивание началось: {option_label}."]
@@ -663,7 +960,7 @@ async def format_selection_callback(update: Update, context: ContextTypes.DEFAUL
         await query.edit_message_text("Не удалось запустить загрузку. Пришлите ссылку заново.")
         return
 
-    logger.info(f"Starting download for chat {chat_id} with format {option.get('format_id')} ({option_label})")
+    logger.info("Starting download for chat {} with format {} ({})", chat_id, option.format_id, option_label)
 
     await _handle_download(
         context=context,
@@ -680,11 +977,12 @@ async def _handle_download(
     chat_id: int,
     status_message_id: int,
     url: str,
-    option: dict,
+    option: FormatOption,
 ) -> None:
     loop = asyncio.get_running_loop()
     reporter = ProgressReporter(context.application, chat_id, status_message_id, loop)
     config = _get_config(context)
+    _ensure_download_dir(context, config)
 
     def on_status(text: str) -> None:
         reporter.status(text)
@@ -695,21 +993,27 @@ async def _handle_download(
     def on_details(text: str) -> None:
         reporter.details(text)
 
-    result = await asyncio.to_thread(
-        download_with_callbacks,
-        url,
-        config,
-        bool(option.get("is_audio_only")),
-        option.get("format_id"),
-        bool(option.get("format_has_audio")),
-        on_status,
-        on_progress,
-        on_details,
-    )
+    reporter.start()
+    try:
+        result = await _run_in_executor(
+            context,
+            "dl_executor",
+            download_with_callbacks,
+            url,
+            config,
+            option.is_audio_only,
+            option.format_id,
+            option.format_has_audio,
+            on_status,
+            on_progress,
+            on_details,
+        )
+    finally:
+        await reporter.stop()
 
     if not result.ok:
         error_text = result.error or "Download failed"
-        logger.error(f"Download failed for {url}: {error_text}")
+        logger.error("Download failed for {}: {}", url, error_text)
         reporter.force_update(_format_error_for_user(error_text))
         return
 
@@ -718,78 +1022,105 @@ async def _handle_download(
         reporter.force_update("Загрузка завершилась, но файл не найден.")
         return
 
-    if _file_too_large(file_path, config):
-        reporter.force_update(
-            f"Файл слишком большой для загрузки в Telegram ({file_path.stat().st_size / (1024 * 1024):.1f} MB)."
-        )
+    size, too_large = _check_size(result.stat, config)
+    if too_large:
+        reporter.force_update(_too_large_message(size))
         return
 
     reporter.force_update("Загружаю файл в Telegram…")
-    caption = f"{BOT_SIGNATURE}\nКачество: {option.get('quality_label') or option.get('label')}"
+    caption = f"{BOT_SIGNATURE}\nКачество: {option.quality_label or option.label}"
 
     async def _send_audio(path: Path) -> None:
-        with open(path, "rb") as f:
-            input_file = InputFile(f, filename=path.name)
-            await context.bot.send_audio(chat_id=chat_id, audio=input_file, caption=caption)
-
-    async def _send_video(path: Path) -> None:
-        dims = _probe_video_dimensions(path)
-        with open(path, "rb") as f:
-            input_file = InputFile(f, filename=path.name)
-            await context.bot.send_video(
-                chat_id=chat_id,
-                video=input_file,
-                supports_streaming=True,
-                width=dims[0] if dims else None,
-                height=dims[1] if dims else None,
-                caption=caption,
-            )
+        await _send_media(context.bot.send_audio, "audio", path, path.name, chat_id=chat_id, caption=caption)
 
-    async def _send_document(path: Path) -> None:
-        with open(path, "rb") as f:
-            input_file = InputFile(f, filename=path.name)
-            await context.bot.send_document(chat_id=chat_id, document=input_file, caption=caption)
-
-    cleanup_paths = [file_path]
-    send_path = file_path
-    if not option.get("is_audio_only"):
-        if not _is_telegram_video_ext(file_path, option):
-            converted = _convert_to_mp4_for_telegram(file_path, reporter)
-            if converted and converted != file_path:
-                cleanup_paths.append(converted)
-                send_path = converted
-
-    if _file_too_large(send_path, config):
-        reporter.force_update(
-            f"Файл слишком большой для загрузки в Telegram ({send_path.stat().st_size / (1024 * 1024):.1f} MB)."
+    async def _send_video(media: Path, filename: str) -> None:
+        dims = _known_video_dimensions(result.width, result.height) or _known_video_dimensions(
+            option.width, option.height
         )
-        return
+        if not dims:
+            dims = await asyncio.to_thread(_read_mp4_dimensions, media)
+        if not dims and media == file_path and needs_conversion:
+            dims = await asyncio.to_thread(_probe_video_dimensions, media)
+        await _send_media(
+            context.bot.send_video,
+            "video",
+            media,
+            filename,
+            chat_id=chat_id,
+            supports_streaming=True,
+            width=dims[0] if dims else None,
+            height=dims[1] if dims else None,
+            caption=caption,
+        )
+
+    async def _send_document(media: Path, filename: str) -> None:
+        await _send_media(context.bot.send_document, "document", media, filename, chat_id=chat_id, caption=caption)
+
+    # yt-dlp may merge into another container than the format list promised; trust the real suffix too.
+    needs_conversion = option.needs_conversion or file_path.suffix.lstrip(".").lower() not in TELEGRAM_VIDEO_EXTS
+    send_media = file_path
+    send_name = file_path.name
+    if not option.is_audio_only:
+        if needs_conversion:
+            converted, too_large = await asyncio.to_thread(
+                _convert_to_mp4_for_telegram, file_path, reporter, config.max_upload_mb * 1024 * 1024
+            )
+            if too_large:
+                reporter.force_update(
+                    f"Файл слишком большой для загрузки в Telegram (> {config.max_upload_mb} MB после конвертации)."
+                )
+                return
+            if converted is not None:
+                send_media = converted
+                send_name = f"{file_path.stem}.mp4"
 
     try:
-        if option.get("is_audio_only"):
-            await _send_audio(send_path)
+        if option.is_audio_only:
+            await _send_audio(file_path)
         else:
             try:
-                await _send_video(send_path)
+                await _send_video(send_media, send_name)
             except Exception as send_video_error:
                 logger.warning(
-                    f"send_video failed for {send_path.name}, fallback to send_document: {send_video_error}"
+                    "send_video failed for {}, fallback to send_document: {}",
+                    send_name,
+                    send_video_error,
                 )
-                await _send_document(send_path)
+                await _send_document(send_media, send_name)
     except Exception as e:
-        logger.exception(f"Failed to send file: {e}")
+        logger.exception("Failed to send file: {}", e)
         reporter.force_update("Не удалось отправить файл в Telegram. Попробуйте ещё раз.")
         return
+    finally:
+        # The converted copy follows the same cleanup setting as the download it was made from.
+        if send_media != file_path and config.cleanup_after_send:
+            try:
+                await asyncio.to_thread(send_media.unlink, missing_ok=True)
+            except Exception as e:
+                logger.warning("Failed to cleanup file {}: {}", send_media, e)
 
+    cleanup_path = file_path if config.cleanup_after_send else None
+    task = asyncio.create_task(_post_send_cleanup(context, chat_id, status_message_id, reporter, cleanup_path))
+    bg_tasks = _state(context).bg_tasks
+    bg_tasks.add(task)
+    task.add_done_callback(bg_tasks.discard)
+
+
+async def _post_send_cleanup(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    status_message_id: int,
+    reporter: ProgressReporter,
+    file_path: Optional[Path],
+) -> None:
     try:
         await context.bot.delete_message(chat_id=chat_id, message_id=status_message_id)
     except Exception as exc:
-        logger.info(f"Failed to delete status message: {exc}")
+        logger.info("Failed to delete status message: {}", exc)
         reporter.force_update("Готово ✅")
 
-    if config.cleanup_after_send:
-        for path in cleanup_paths:
-            try:
-                path.unlink(missing_ok=True)
-            except Exception as e:
-                logger.warning(f"Failed to cleanup file {path}: {e}")
+    if file_path is not None:
+        try:
+            await asyncio.to_thread(file_path.unlink, missing_ok=True)
+        except Exception as e:
+            logger.warning("Failed to cleanup file {}: {}", file_path, e)
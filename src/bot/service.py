@@ -1,12 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import os
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Dict, List, Optional, Tuple
 
+import heapq
+import importlib.util
 import json
+import re
 import subprocess
+import threading
 import time
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 from src.bot.config import BotConfig
 from src.core.ytsage_downloader import DownloadCallbacks, DownloadThread
 from src.core.ytsage_yt_dlp import check_ytdlp_binary, check_ytdlp_installed, download_ytdlp
@@ -16,15 +28,58 @@ from src.utils.ytsage_logger import logger
 from src.utils.ytsage_cookies import ensure_fresh_cookies, refresh_cookies_now
 from src.core.ytsage_yt_dlp import get_yt_dlp_path
 
+TELEGRAM_VIDEO_EXTS = frozenset({"mp4", "m4v", "mov"})
+MP4_AUDIO_EXTS = frozenset({"m4a", "mp4"})
+# DownloadThread names files "%(title)s_%(resolution)s.%(ext)s"; resolution is WIDTHxHEIGHT for video.
+RESOLUTION_SUFFIX_RE = re.compile(r"_(\d+)x(\d+)$")
+MAX_VIDEO_OPTIONS = 8
+INVALID_COOKIE_RE = re.compile(
+    r"cookies are no longer valid|sign in to confirm|use --cookies-from-browser|use --cookies for the authentication",
+    re.IGNORECASE,
+)
+# stderr markers that mean format listing may succeed when retried with cookies.
+AUTH_ERROR_RE = re.compile(
+    r"sign in|login required|private|members[ -]only|age restricted|confirm your age|cookies|bot"
+    r"|requested format is not available",
+    re.IGNORECASE,
+)
+# Top-level info fields list_formats reads; the rest (subtitles, thumbnails, ...) is dropped by yt-dlp.
+INFO_FIELDS = ("_type", "title", "duration", "duration_string", "formats")
+INFO_TEMPLATE = f"%(.{{{','.join(INFO_FIELDS)}}})j"
+YTDLP_LIST_ARGS = ("--ignore-config", "--print", INFO_TEMPLATE, "--no-warnings", "--no-playlist")
+# Environment variables that would inject extra options into yt-dlp.
+YTDLP_OPTION_ENV_VARS = frozenset(
+    {"YT_DLP_OPTS", "YTDLP_OPTS", "YTDL_OPTS", "YOUTUBE_DL_OPTS", "YOUTUBE_DL_ARGS", "YTDLP_ARGS"}
+)
+
+_PROBE_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix="ytprobe")
+# list_formats extracts in-process when the yt_dlp package is importable, skipping a subprocess per call.
+_YT_DLP_MODULE_AVAILABLE = importlib.util.find_spec("yt_dlp") is not None
+_ytdlp_env_cache: Dict[str, Dict[str, str]] = {}
+
+
+def _ytdlp_env() -> Dict[str, str]:
+    """Return os.environ without yt-dlp option variables, rebuilt only when PATH changes."""
+    path = os.environ.get("PATH", "")
+    env = _ytdlp_env_cache.get(path)
+    if env is None:
+        _ytdlp_env_cache.clear()
+        env = {key: value for key, value in os.environ.items() if key not in YTDLP_OPTION_ENV_VARS}
+        _ytdlp_env_cache[path] = env
+    return env
+
 
 @dataclass
 class DownloadResult:
     ok: bool
     file_path: Optional[Path]
     error: Optional[str]
+    width: Optional[int] = None
+    height: Optional[int] = None
+    stat: Optional[os.stat_result] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FormatOption:
     format_id: str
     label: str
@@ -33,6 +88,9 @@ class FormatOption:
     format_has_audio: bool
     ext: Optional[str]
     filesize: Optional[int]
+    width: Optional[int] = None
+    height: Optional[int] = None
+    needs_conversion: bool = False
 
 
 @dataclass
@@ -62,7 +120,15 @@ def download_with_callbacks(
     on_progress=None,
     on_details=None,
 ) -> DownloadResult:
-    if not check_ytdlp_installed():
+    js_runtimes = config.js_runtime
+    setup_deno = not js_runtimes and config.auto_setup_deno
+    ytdlp_probe = _PROBE_POOL.submit(check_ytdlp_installed)
+    ffmpeg_probe = None
+    if config.force_output_format and not is_audio_only and not format_id:
+        ffmpeg_probe = _PROBE_POOL.submit(check_ffmpeg_installed)
+    deno_probe = _PROBE_POOL.submit(check_deno_installed) if setup_deno else None
+
+    if not ytdlp_probe.result():
         try:
             if on_status:
                 on_status("yt-dlp не найден, загружаю...")
@@ -70,10 +136,9 @@ def download_with_callbacks(
         except Exception as exc:
             return DownloadResult(ok=False, file_path=None, error=f"Failed to set up yt-dlp: {exc}")
 
-    js_runtimes = config.js_runtime
-    if not js_runtimes and config.auto_setup_deno:
+    if deno_probe is not None:
         try:
-            if not check_deno_installed():
+            if not deno_probe.result():
                 if on_status:
                     on_status("Deno не найден, загружаю...")
                 download_deno()
@@ -83,7 +148,7 @@ def download_with_callbacks(
             else:
                 js_runtimes = "deno"
         except Exception as exc:
-            logger.warning(f"Failed to set up Deno JS runtime: {exc}")
+            logger.warning("Failed to set up Deno JS runtime: {}", exc)
 
     ensure_fresh_cookies(
         cookie_file=config.cookie_file,
@@ -96,7 +161,7 @@ def download_with_callbacks(
 
     cookie_file = config.cookie_file
     if cookie_file and not cookie_file.exists():
-        logger.warning(f"Cookie file does not exist: {cookie_file}")
+        logger.warning("Cookie file does not exist: {}", cookie_file)
         cookie_file = None
 
     def _run_once() -> DownloadResult:
@@ -112,23 +177,18 @@ def download_with_callbacks(
         preferred_output_format = config.preferred_output_format
         format_selector = None
         if not is_audio_only and not format_id:
-            if config.force_output_format and check_ffmpeg_installed():
+            if config.force_output_format and ffmpeg_probe.result():
                 force_output_format = True
-                if preferred_output_format.lower() == "mp4":
-                    res_value = config.default_resolution.strip()
-                    height_filter = ""
-                    if res_value.isdigit():
-                        height_filter = f"[height<={res_value}]"
-                    format_selector = (
-                        f"bestvideo[vcodec~='avc1']{height_filter}+bestaudio[ext=m4a]/"
-                        f"best[ext=mp4]/best"
-                    )
+                format_selector = config.mp4_format_selector
             elif config.force_output_format and on_status:
                 on_status("FFmpeg не найден — не могу принудительно выставить формат.")
 
         if format_id:
             logger.info(
-                f"Using explicit format id: {format_id} (audio_only={is_audio_only}, has_audio={format_has_audio})"
+                "Using explicit format id: {} (audio_only={}, has_audio={})",
+                format_id,
+                is_audio_only,
+                format_has_audio,
             )
 
         worker = DownloadThread(
@@ -162,7 +222,7 @@ def download_with_callbacks(
             callbacks=callbacks,
         )
 
-        logger.info(f"Starting download for URL: {url}")
+        logger.info("Starting download for URL: {}", url)
         worker.run()
 
         if observer.error_message:
@@ -170,8 +230,22 @@ def download_with_callbacks(
 
         if worker.last_file_path:
             file_path = Path(worker.last_file_path)
-            if file_path.exists():
-                return DownloadResult(ok=True, file_path=file_path, error=None)
+            try:
+                stat = file_path.stat()
+            except OSError:
+                stat = None
+            if stat is not None:
+                match = RESOLUTION_SUFFIX_RE.search(file_path.stem)
+                if match:
+                    return DownloadResult(
+                        ok=True,
+                        file_path=file_path,
+                        error=None,
+                        width=int(match.group(1)),
+                        height=int(match.group(2)),
+                        stat=stat,
+                    )
+                return DownloadResult(ok=True, file_path=file_path, error=None, stat=stat)
 
         return DownloadResult(ok=False, file_path=None, error="Download finished but file was not found")
 
@@ -179,14 +253,7 @@ def download_with_callbacks(
     if result.ok or not result.error:
         return result
 
-    error_text = result.error.lower()
-    invalid_cookie_markers = (
-        "cookies are no longer valid",
-        "sign in to confirm",
-        "use --cookies-from-browser",
-        "use --cookies for the authentication",
-    )
-    if config.cookie_auto_refresh and any(marker in error_text for marker in invalid_cookie_markers):
+    if config.cookie_auto_refresh and INVALID_COOKIE_RE.search(result.error):
         logger.warning("Detected invalid cookies; attempting refresh and retry")
         refresh_result = refresh_cookies_now(
             cookie_file=cookie_file,
@@ -217,24 +284,29 @@ def _format_size_bytes(value: Optional[float]) -> Optional[int]:
     return None
 
 
-def _pick_best_by_quality(formats: Iterable[dict], prefer_progressive: bool) -> Optional[dict]:
-    candidates = [f for f in formats if f.get("format_id")]
-    if not candidates:
+def _to_int_or_none(value) -> Optional[int]:
+    if not value:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(round(value))
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
         return None
 
-    def _score(fmt: dict) -> tuple:
-        size = fmt.get("filesize") or fmt.get("filesize_approx") or 0
-        tbr = fmt.get("tbr") or 0
-        abr = fmt.get("abr") or 0
-        has_audio = fmt.get("acodec") not in (None, "none")
-        return (
-            1 if (prefer_progressive and has_audio) else 0,
-            size,
-            tbr,
-            abr,
-        )
 
-    return max(candidates, key=_score)
+def _quality_score(fmt: dict, progressive: bool) -> tuple:
+    size = fmt.get("filesize") or fmt.get("filesize_approx") or 0
+    tbr = fmt.get("tbr") or 0
+    abr = fmt.get("abr") or 0
+    return (
+        1 if progressive else 0,
+        size,
+        tbr,
+        abr,
+    )
 
 
 def _duration_to_string(duration_seconds: Optional[float]) -> Optional[str]:
@@ -252,7 +324,64 @@ def _duration_to_string(duration_seconds: Optional[float]) -> Optional[str]:
         return None
 
 
+def _is_complete_json_line(line: bytes) -> bool:
+    if not line.endswith(b"\n") or not line.strip():
+        return False
+    try:
+        return isinstance(_json_loads(line), dict)
+    except ValueError:
+        return False
+
+
+def _run_until_first_line(cmd: List[str], env: Dict[str, str], timeout: float) -> subprocess.CompletedProcess[bytes]:
+    """Run cmd, stopping it as soon as it prints a complete JSON object line on stdout."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, bufsize=1 << 20)
+    stderr_chunks: List[bytes] = []
+
+    def _drain_stderr() -> None:
+        # Collected in chunks so whatever arrived is still reported if the join below gives up.
+        for chunk in iter(lambda: proc.stderr.read1(64 * 1024), b""):
+            stderr_chunks.append(chunk)
+
+    # Drain stderr in the background so a chatty child can't block on a full pipe.
+    stderr_reader = threading.Thread(target=_drain_stderr, daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+
+    def _on_timeout() -> None:
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _on_timeout)
+    timer.start()
+    stopped_early = False
+    try:
+        first_line = proc.stdout.readline()
+        if _is_complete_json_line(first_line) and proc.poll() is None:
+            proc.terminate()
+            stopped_early = True
+        returncode = proc.wait()
+    finally:
+        timer.cancel()
+    stderr_reader.join(timeout=5)
+    if stderr_reader.is_alive():
+        logger.warning("yt-dlp stderr still open after exit; reporting the output read so far")
+    proc.stdout.close()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(
+        cmd,
+        0 if stopped_early else returncode,
+        first_line,
+        b"".join(list(stderr_chunks)),
+    )
+
+
 def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResult:
+    info = _extract_info_in_process(url, config)
+    if info is not None:
+        return _format_list_from_info(info)
+
     if not check_ytdlp_installed():
         try:
             if on_status:
@@ -282,31 +411,29 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
 
     cookie_file = config.cookie_file
     if cookie_file and not cookie_file.exists():
-        logger.warning(f"Cookie file does not exist: {cookie_file}")
+        logger.warning("Cookie file does not exist: {}", cookie_file)
         cookie_file = None
 
-    yt_dlp_path = get_yt_dlp_path()
+    yt_dlp_path = str(get_yt_dlp_path())
+
     def _run_list(
         cookie_file_path: Optional[Path],
         allow_browser_cookies: bool,
-    ) -> tuple[subprocess.CompletedProcess[str], float]:
-        cmd = [str(yt_dlp_path), "--ignore-config", "--dump-json", "--no-warnings", "--no-playlist", url]
+    ) -> tuple[subprocess.CompletedProcess[bytes], float]:
+        cmd = [yt_dlp_path, *YTDLP_LIST_ARGS, url]
         if cookie_file_path:
             cmd.extend(["--cookies", str(cookie_file_path)])
         elif allow_browser_cookies and config.browser_cookies:
             cmd.extend(["--cookies-from-browser", config.browser_cookies])
-        env = os.environ.copy()
-        for key in ("YT_DLP_OPTS", "YTDLP_OPTS", "YTDL_OPTS", "YOUTUBE_DL_OPTS", "YOUTUBE_DL_ARGS", "YTDLP_ARGS"):
-            env.pop(key, None)
         started_at = time.monotonic()
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60, env=env)
+        result = _run_until_first_line(cmd, _ytdlp_env(), timeout=60)
         elapsed = time.monotonic() - started_at
         return result, elapsed
 
     def _run_list_checked(
         cookie_file_path: Optional[Path],
         allow_browser_cookies: bool,
-    ) -> tuple[Optional[subprocess.CompletedProcess[str]], Optional[float], Optional[str]]:
+    ) -> tuple[Optional[subprocess.CompletedProcess[bytes]], Optional[float], Optional[str]]:
         try:
             result, elapsed = _run_list(cookie_file_path, allow_browser_cookies)
             return result, elapsed, None
@@ -331,20 +458,7 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
     used_cookies = False
 
     if result and result.returncode != 0 and cookies_available:
-        error_text = result.stderr.strip().lower()
-        auth_markers = (
-            "sign in",
-            "login required",
-            "private",
-            "members only",
-            "members-only",
-            "age restricted",
-            "confirm your age",
-            "cookies",
-            "bot",
-            "requested format is not available",
-        )
-        if any(marker in error_text for marker in auth_markers):
+        if AUTH_ERROR_RE.search(result.stderr.decode(errors="replace")):
             logger.warning("Format listing failed without cookies; retrying with cookies")
             result, elapsed, run_error = _run_list_checked(cookie_file, True)
             used_cookies = True
@@ -358,17 +472,14 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
                 )
 
     if result.returncode != 0:
-        error_text = result.stderr.strip()
+        error_text = result.stderr.decode(errors="replace").strip()
         logger.error(
-            f"yt-dlp format listing failed (code={result.returncode}, elapsed={elapsed:.2f}s): {error_text}"
-        )
-        invalid_cookie_markers = (
-            "cookies are no longer valid",
-            "sign in to confirm",
-            "use --cookies-from-browser",
-            "use --cookies for the authentication",
+            "yt-dlp format listing failed (code={}, elapsed={:.2f}s): {}",
+            result.returncode,
+            elapsed,
+            error_text,
         )
-        if used_cookies and config.cookie_auto_refresh and any(marker in error_text.lower() for marker in invalid_cookie_markers):
+        if used_cookies and config.cookie_auto_refresh and INVALID_COOKIE_RE.search(error_text):
             logger.warning("Detected invalid cookies during format listing; attempting refresh and retry")
             refresh_result = refresh_cookies_now(
                 cookie_file=cookie_file,
@@ -401,9 +512,12 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
                         error=f"Failed to run yt-dlp: {exc}",
                     )
                 if result.returncode != 0:
-                    error_text = result.stderr.strip()
+                    error_text = result.stderr.decode(errors="replace").strip()
                     logger.error(
-                        f"yt-dlp format listing failed after refresh (code={result.returncode}, elapsed={elapsed:.2f}s): {error_text}"
+                        "yt-dlp format listing failed after refresh (code={}, elapsed={:.2f}s): {}",
+                        result.returncode,
+                        elapsed,
+                        error_text,
                     )
                     return FormatListResult(
                         ok=False,
@@ -413,7 +527,7 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
                         error=error_text or "yt-dlp failed",
                     )
             else:
-                logger.warning(f"Cookie refresh failed during format listing: {refresh_result.error}")
+                logger.warning("Cookie refresh failed during format listing: {}", refresh_result.error)
                 return FormatListResult(
                     ok=False,
                     title=None,
@@ -430,17 +544,50 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
                 error=error_text or "yt-dlp failed",
             )
 
-    json_lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
-    if not json_lines:
+    first_line = result.stdout.partition(b"\n")[0].strip()
+    if not first_line:
         logger.error("yt-dlp returned no JSON data for format listing")
         return FormatListResult(ok=False, title=None, duration=None, options=[], error="No data returned")
 
     try:
-        info = json.loads(json_lines[0])
+        info = _json_loads(first_line)
     except json.JSONDecodeError as exc:
         logger.exception("Failed to parse yt-dlp JSON output")
         return FormatListResult(ok=False, title=None, duration=None, options=[], error=str(exc))
 
+    return _format_list_from_info(info)
+
+
+def _extract_info_in_process(url: str, config: BotConfig) -> Optional[dict]:
+    """Extract video info with the yt_dlp module if it is installed; None means fall back to the binary."""
+    # Cookie handling (refresh and the retry without cookies) lives in the binary path.
+    if not _YT_DLP_MODULE_AVAILABLE or config.cookie_file or config.browser_cookies:
+        return None
+    js_runtime = config.js_runtime
+    if not js_runtime:
+        if not check_deno_installed():
+            return None
+        deno_path = get_deno_path()
+        js_runtime = f"deno:{deno_path}" if isinstance(deno_path, Path) else "deno"
+    from yt_dlp import YoutubeDL
+
+    runtime, _, runtime_path = js_runtime.partition(":")
+    params = {
+        "quiet": True,
+        "no_warnings": True,
+        "noplaylist": True,
+        "skip_download": True,
+        "js_runtimes": {runtime.strip().lower(): {"path": runtime_path or None}},
+    }
+    try:
+        with YoutubeDL(params) as ydl:
+            return ydl.extract_info(url, download=False)
+    except Exception as exc:
+        logger.info("In-process yt-dlp extraction failed, falling back to the binary: {}", exc)
+        return None
+
+
+def _format_list_from_info(info: dict) -> FormatListResult:
     if info.get("_type") == "playlist":
         logger.info("Playlist detected; not supported in bot flow")
         return FormatListResult(
@@ -462,69 +609,75 @@ def list_formats(url: str, config: BotConfig, on_status=None) -> FormatListResul
             error="No formats found",
         )
 
-    audio_formats = [
-        f for f in formats if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
-    ]
-    video_formats = [f for f in formats if f.get("vcodec") not in (None, "none")]
+    # One pass: keep the best audio-only format and the best video format per height.
+    best_audio: Optional[dict] = None
+    best_audio_score: Optional[tuple] = None
+    best_by_height: Dict[int, Tuple[tuple, dict, bool]] = {}
+    for fmt in formats:
+        if not fmt.get("format_id"):
+            continue
+        has_audio = fmt.get("acodec") not in (None, "none")
+        vcodec = fmt.get("vcodec")
+        if vcodec == "none":
+            if not has_audio:
+                continue
+            score = _quality_score(fmt, progressive=False)
+            if best_audio_score is None or score > best_audio_score:
+                best_audio, best_audio_score = fmt, score
+        elif vcodec is not None:
+            height = fmt.get("height")
+            if not height:
+                continue
+            score = _quality_score(fmt, progressive=has_audio)
+            current = best_by_height.get(height)
+            if current is None or score > current[0]:
+                best_by_height[height] = (score, fmt, has_audio)
 
     options: List[FormatOption] = []
-
-    if video_formats:
-        heights = sorted({f.get("height") for f in video_formats if f.get("height")}, reverse=True)
-        for height in heights:
-            candidates = [f for f in video_formats if f.get("height") == height]
-            best = _pick_best_by_quality(candidates, prefer_progressive=True)
-            if not best:
-                continue
-            ext = best.get("ext")
-            fps = best.get("fps")
-            label = f"{height}p"
-            if fps:
-                try:
-                    fps_value = int(round(float(fps)))
-                    if fps_value >= 50:
-                        label = f"{label} {fps_value}fps"
-                except (TypeError, ValueError):
-                    pass
-            quality_label = label + (f" ({ext})" if ext else "")
-            options.append(
-                FormatOption(
-                    format_id=str(best.get("format_id")),
-                    label=label,
-                    quality_label=quality_label,
-                    is_audio_only=False,
-                    format_has_audio=best.get("acodec") not in (None, "none"),
-                    ext=ext,
-                    filesize=_format_size_bytes(best.get("filesize") or best.get("filesize_approx")),
-                )
+    merged_audio_is_mp4 = bool(best_audio) and best_audio.get("ext") in MP4_AUDIO_EXTS
+
+    for height in heapq.nlargest(MAX_VIDEO_OPTIONS, best_by_height):
+        _, best, format_has_audio = best_by_height[height]
+        ext = best.get("ext")
+        fps_value = _to_int_or_none(best.get("fps"))
+        label = f"{height}p"
+        if fps_value is not None and fps_value >= 50:
+            label = f"{label} {fps_value}fps"
+        quality_label = label + (f" ({ext})" if ext else "")
+        options.append(
+            FormatOption(
+                format_id=str(best.get("format_id")),
+                label=label,
+                quality_label=quality_label,
+                is_audio_only=False,
+                format_has_audio=format_has_audio,
+                ext=ext,
+                filesize=_format_size_bytes(best.get("filesize") or best.get("filesize_approx")),
+                width=best.get("width"),
+                height=height,
+                needs_conversion=ext not in TELEGRAM_VIDEO_EXTS
+                or not (format_has_audio or merged_audio_is_mp4),
             )
-            if len(options) >= 8:
-                break
-
-    if audio_formats:
-        best_audio = _pick_best_by_quality(audio_formats, prefer_progressive=False)
-        if best_audio:
-            ext = best_audio.get("ext")
-            abr = best_audio.get("abr") or best_audio.get("tbr")
-            label = "Аудио"
-            if abr:
-                try:
-                    abr_value = int(round(float(abr)))
-                    label = f"{label} {abr_value}k"
-                except (TypeError, ValueError):
-                    pass
-            quality_label = "Аудио" + (f" ({ext})" if ext else "")
-            options.append(
-                FormatOption(
-                    format_id=str(best_audio.get("format_id")),
-                    label=label,
-                    quality_label=quality_label,
-                    is_audio_only=True,
-                    format_has_audio=True,
-                    ext=ext,
-                    filesize=_format_size_bytes(best_audio.get("filesize") or best_audio.get("filesize_approx")),
-                )
+        )
+
+    if best_audio:
+        ext = best_audio.get("ext")
+        abr_value = _to_int_or_none(best_audio.get("abr") or best_audio.get("tbr"))
+        label = "Аудио"
+        if abr_value is not None:
+            label = f"{label} {abr_value}k"
+        quality_label = "Аудио" + (f" ({ext})" if ext else "")
+        options.append(
+            FormatOption(
+                format_id=str(best_audio.get("format_id")),
+                label=label,
+                quality_label=quality_label,
+                is_audio_only=True,
+                format_has_audio=True,
+                ext=ext,
+                filesize=_format_size_bytes(best_audio.get("filesize") or best_audio.get("filesize_approx")),
             )
+        )
 
     title = info.get("title")
     duration = info.get("duration_string") or _duration_to_string(info.get("duration"))
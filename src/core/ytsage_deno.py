@@ -1,13 +1,20 @@
+import hashlib
 import os
+import re
+import shutil
 import subprocess
-import tempfile
+import time
 import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Dict, Optional, Tuple, TypeVar, Union
 
 import requests
+from packaging import version
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from src.core.ytsage_ffmpeg import get_file_sha256
 from src.utils.ytsage_constants import (
     APP_BIN_DIR,
     DENO_APP_BIN_PATH,
@@ -18,39 +25,58 @@ from src.utils.ytsage_constants import (
 )
 from src.utils.ytsage_logger import logger
 
+_T = TypeVar("_T")
+# Deno publishes either "<hash>  <file>" or PowerShell-style "Hash : <HASH>" checksum files.
+_SHA256_HEX_RE = re.compile(rb"\b([0-9a-fA-F]{64})\b")
+_DENO_VERSION_RE = re.compile(r"deno (\S+)")
 
-def verify_deno_sha256(file_path: Path, sha256_url: str) -> bool:
-    """Verify Deno file SHA256 hash against official checksums."""
+# Shared session so repeated checksum/release lookups reuse the TLS connection.
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=Retry(total=2, backoff_factor=0.3)),
+)
+
+BINARY_CHECK_TTL_SECONDS = 60.0
+_binary_checks: Dict[str, Tuple[float, object]] = {}
+
+
+def invalidate_binary_checks() -> None:
+    """Forget cached Deno binary lookups, e.g. after installing or upgrading."""
+    _binary_checks.clear()
+
+
+def _cached_check(key: str, check: Callable[[], _T]) -> _T:
+    entry = _binary_checks.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    value = check()
+    _binary_checks[key] = (now + BINARY_CHECK_TTL_SECONDS, value)
+    return value
+
+
+def verify_deno_sha256(
+    actual_hash: str,
+    sha256_url: str,
+    checksum_request: Optional[Future[requests.Response]] = None,
+) -> bool:
+    """Verify a computed Deno SHA256 hash against official checksums."""
     try:
-        logger.info(f"Downloading SHA256 checksum from: {sha256_url}")
-        response = requests.get(sha256_url, timeout=10)
+        if checksum_request is not None:
+            response = checksum_request.result()
+        else:
+            logger.info(f"Downloading SHA256 checksum from: {sha256_url}")
+            response = _session.get(sha256_url, timeout=10)
         response.raise_for_status()
-        checksum_content = response.text
-
-        expected_hash = None
-        for line in checksum_content.strip().split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-
-            if len(line) >= 64 and (" " in line or "\t" in line):
-                potential_hash = line.split()[0]
-                if len(potential_hash) == 64 and all(c in "0123456789abcdefABCDEF" for c in potential_hash):
-                    expected_hash = potential_hash
-                    break
-
-            if line.startswith("Hash"):
-                parts = line.split(":", 1)
-                if len(parts) == 2:
-                    expected_hash = parts[1].strip()
-                    break
+        match = _SHA256_HEX_RE.search(response.content)
+        expected_hash = match.group(1).decode("ascii") if match else None
 
         if not expected_hash:
             logger.error("Could not find SHA256 hash in checksum file")
-            logger.debug(f"Checksum file content: {checksum_content}")
+            logger.debug(f"Checksum file content: {response.text}")
             return False
 
-        actual_hash = get_file_sha256(file_path)
         if actual_hash.lower() == expected_hash.lower():
             logger.info("SHA256 verification successful")
             return True
@@ -69,39 +95,51 @@ def verify_deno_sha256(file_path: Path, sha256_url: str) -> bool:
 
 def download_deno() -> Path:
     """Download and extract Deno into the app bin directory."""
-    temp_zip_path = None
+    # Keep the archive next to the binary so extraction stays on one filesystem.
+    temp_zip_path = APP_BIN_DIR / f".deno-download.{os.getpid()}.zip"
     try:
-        temp_zip_fd, temp_zip_path = tempfile.mkstemp(suffix=".zip")
-        os.close(temp_zip_fd)
-
-        logger.info(f"Downloading Deno from: {DENO_DOWNLOAD_URL}")
-        response = requests.get(DENO_DOWNLOAD_URL, stream=True, timeout=30)
-        response.raise_for_status()
-        total_size = int(response.headers.get("content-length", 0))
-        block_size = 8192
-
-        with open(temp_zip_path, "wb") as f:
-            downloaded = 0
-            for data in response.iter_content(block_size):
-                f.write(data)
-                downloaded += len(data)
-                if total_size > 0 and downloaded % (block_size * 128) == 0:
-                    percent = int(downloaded / total_size * 100)
-                    logger.debug(f"Deno download {percent}%")
-
-        logger.info("Download complete, verifying SHA256 hash...")
-        if not verify_deno_sha256(Path(temp_zip_path), DENO_SHA256_URL):
+        with ThreadPoolExecutor(max_workers=1) as checksum_pool:
+            logger.info(f"Downloading SHA256 checksum from: {DENO_SHA256_URL}")
+            checksum_request = checksum_pool.submit(_session.get, DENO_SHA256_URL, timeout=10)
+
+            logger.info(f"Downloading Deno from: {DENO_DOWNLOAD_URL}")
+            response = _session.get(DENO_DOWNLOAD_URL, stream=True, timeout=30)
+            response.raise_for_status()
+            total_size = int(response.headers.get("content-length", 0))
+            block_size = 8192
+            hasher = hashlib.sha256()
+
+            with open(temp_zip_path, "wb") as f:
+                downloaded = 0
+                next_log = time.monotonic() + 1.0
+                for data in response.iter_content(block_size):
+                    f.write(data)
+                    hasher.update(data)
+                    downloaded += len(data)
+                    if total_size > 0 and time.monotonic() >= next_log:
+                        percent = int(downloaded / total_size * 100)
+                        logger.debug(f"Deno download {percent}%")
+                        next_log += 1.0
+
+            logger.info("Download complete, verifying SHA256 hash...")
+            verified = verify_deno_sha256(hasher.hexdigest(), DENO_SHA256_URL, checksum_request)
+
+        if not verified:
             logger.error("SHA256 verification failed, removing downloaded file")
-            if Path(temp_zip_path).exists():
-                Path(temp_zip_path).unlink()
+            temp_zip_path.unlink(missing_ok=True)
             raise RuntimeError("SHA256 verification failed for Deno")
 
         logger.info("Extracting Deno executable...")
         with zipfile.ZipFile(temp_zip_path, "r") as zip_ref:
             executable_name = "deno.exe" if OS_NAME == "Windows" else "deno"
-            if executable_name not in zip_ref.namelist():
-                raise RuntimeError(f"Executable '{executable_name}' not found in zip")
-            zip_ref.extract(executable_name, APP_BIN_DIR)
+            try:
+                member = zip_ref.getinfo(executable_name)
+            except KeyError:
+                raise RuntimeError(f"Executable '{executable_name}' not found in zip") from None
+            temp_exe_path = APP_BIN_DIR / f".{executable_name}.{os.getpid()}.tmp"
+            with zip_ref.open(member) as src, open(temp_exe_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(temp_exe_path, APP_BIN_DIR / executable_name)
 
         exe_path = DENO_APP_BIN_PATH
         if not exe_path.exists():
@@ -109,21 +147,24 @@ def download_deno() -> Path:
 
         if OS_NAME != "Windows":
             os.chmod(exe_path, 0o755)
+        invalidate_binary_checks()
 
-        if temp_zip_path and Path(temp_zip_path).exists():
-            Path(temp_zip_path).unlink()
+        temp_zip_path.unlink(missing_ok=True)
 
         logger.info("Deno downloaded, verified, and extracted successfully")
         return exe_path
     except Exception as e:
         logger.exception(f"Error downloading/extracting Deno: {e}")
-        if temp_zip_path and Path(temp_zip_path).exists():
-            Path(temp_zip_path).unlink()
+        temp_zip_path.unlink(missing_ok=True)
         raise
 
 
 def check_deno_binary() -> Optional[Path]:
     """Check if Deno binary exists in the app's bin directory."""
+    return _cached_check("binary", _find_deno_binary)
+
+
+def _find_deno_binary() -> Optional[Path]:
     exe_path = DENO_APP_BIN_PATH
     if exe_path.exists():
         if OS_NAME != "Windows" and not os.access(exe_path, os.X_OK):
@@ -141,6 +182,10 @@ def check_deno_binary() -> Optional[Path]:
 
 def check_deno_installed() -> bool:
     """Check if Deno is installed and accessible."""
+    return _cached_check("installed", _run_deno_version_check)
+
+
+def _run_deno_version_check() -> bool:
     try:
         deno_path = check_deno_binary() or "deno"
         result = subprocess.run(
@@ -158,6 +203,10 @@ def check_deno_installed() -> bool:
 
 def get_deno_path() -> Union[Path, str]:
     """Get the Deno path from the app bin directory or fall back to PATH."""
+    return _cached_check("path", _resolve_deno_path)
+
+
+def _resolve_deno_path() -> Union[Path, str]:
     deno_path = check_deno_binary()
     if deno_path:
         logger.info(f"Using Deno from: {deno_path}")
@@ -181,10 +230,10 @@ def get_deno_version_direct(deno_path: Optional[str] = None) -> str:
         )
         if result.returncode != 0:
             return "Unknown"
-        first_line = result.stdout.splitlines()[0] if result.stdout else ""
-        if first_line.startswith("deno "):
-            return first_line.split()[1]
-        return first_line.strip() or "Unknown"
+        match = _DENO_VERSION_RE.match(result.stdout)
+        if match:
+            return match.group(1)
+        return result.stdout.partition("\n")[0].strip() or "Unknown"
     except Exception as e:
         logger.exception(f"Error getting Deno version: {e}")
         return "Unknown"
@@ -193,13 +242,13 @@ def get_deno_version_direct(deno_path: Optional[str] = None) -> str:
 def get_latest_deno_version() -> Optional[str]:
     """Fetch the latest Deno version from GitHub API."""
     try:
-        response = requests.get("https://api.github.com/repos/denoland/deno/releases/latest", timeout=10)
+        response = _session.get("https://api.github.com/repos/denoland/deno/releases/latest", timeout=10)
         response.raise_for_status()
         data = response.json()
-        version = data.get("tag_name", "").lstrip("v")
-        if version:
-            logger.info(f"Latest Deno version: {version}")
-            return version
+        latest_version = data.get("tag_name", "").lstrip("v")
+        if latest_version:
+            logger.info(f"Latest Deno version: {latest_version}")
+            return latest_version
         return None
     except requests.RequestException as e:
         logger.error(f"Failed to fetch latest Deno version: {e}")
@@ -209,12 +258,15 @@ def get_latest_deno_version() -> Optional[str]:
         return None
 
 
+@lru_cache(maxsize=32)
+def _parse_version(value: str) -> version.Version:
+    return version.parse(value)
+
+
 def compare_deno_versions(current: str, latest: str) -> bool:
     """Return True if latest is newer than current."""
     try:
-        current_tuple = tuple(int(part) for part in current.split("."))
-        latest_tuple = tuple(int(part) for part in latest.split("."))
-        return latest_tuple > current_tuple
+        return _parse_version(latest) > _parse_version(current)
     except Exception as e:
         logger.warning(f"Could not compare Deno versions: {e}")
         return False
@@ -238,6 +290,7 @@ def upgrade_deno() -> tuple[bool, str]:
             check=False,
         )
         if result.returncode == 0:
+            invalidate_binary_checks()
             return True, "Deno upgrade successful"
         return False, f"Deno upgrade failed with code {result.returncode}: {result.stderr.strip()}"
     except subprocess.TimeoutExpired:
@@ -54,10 +54,14 @@ def download_file(url, dest_path, progress_callback=None) -> bool:
 
 def get_file_sha256(file_path) -> str:
     """Calculate SHA-256 hash of a file."""
-    sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(chunk)
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256_hash = hashlib.sha256()
+        buffer = bytearray(1024 * 1024)
+        view = memoryview(buffer)
+        while size := f.readinto(buffer):
+            sha256_hash.update(view[:size])
     return sha256_hash.hexdigest()
 
 
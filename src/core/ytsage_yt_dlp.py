@@ -1,8 +1,12 @@
+import hashlib
+import json
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 
 import requests
 
@@ -16,6 +20,11 @@ from src.utils.ytsage_constants import (
 )
 from src.utils.ytsage_logger import logger
 
+# Last checksums response with its validators, so unchanged lists come back as a bodiless 304.
+_CHECKSUM_CACHE_PATH = YTDLP_APP_BIN_PATH.parent / ".checksums.cache"
+# App-bin yt-dlp once found; misses are not remembered so a binary installed later is picked up.
+_resolved_ytdlp_path: Optional[Path] = None
+
 
 def _curl_path() -> Optional[str]:
     return shutil.which("curl")
@@ -41,57 +50,99 @@ def _download_file_with_curl(url: str, dest: Path, timeout: int = 120) -> None:
     if not curl:
         raise RuntimeError("curl is not available")
     result = subprocess.run(
-        [curl, "-fL", "-o", str(dest), url],
-        capture_output=True,
-        text=True,
+        [curl, "-fL", "--silent", "--show-error", "-o", str(dest), url],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
         timeout=timeout,
     )
     if result.returncode != 0:
-        raise RuntimeError(f"curl failed: {result.stderr.strip()}")
+        raise RuntimeError(f"curl failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+def _read_checksum_cache(url: str) -> Optional[dict]:
+    try:
+        cached = json.loads(_CHECKSUM_CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("url") != url or not isinstance(cached.get("body"), str):
+        return None
+    return cached
+
+
+def _write_checksum_cache(url: str, response: requests.Response, body: str) -> None:
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    payload = {"url": url, "etag": etag, "last_modified": last_modified, "body": body}
+    try:
+        _CHECKSUM_CACHE_PATH.write_text(json.dumps(payload), encoding="utf-8")
+    except OSError as exc:
+        logger.debug(f"Could not write checksum cache: {exc}")
+
+
+def _load_checksums(url: str) -> Dict[str, str]:
+    """Download a SHA256 checksums file and map file names to hashes."""
+    logger.info(f"Downloading SHA256 checksums from: {url}")
+    cached = _read_checksum_cache(url)
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached:
+            logger.info("Checksums not modified, using cached copy")
+            checksum_content = cached["body"]
+        else:
+            response.raise_for_status()
+            checksum_content = response.text
+            _write_checksum_cache(url, response, checksum_content)
+    except requests.RequestException as exc:
+        logger.warning(f"Failed to download checksums via requests: {exc}")
+        checksum_content = _download_text_with_curl(url, timeout=30)
+    return {parts[1]: parts[0] for line in checksum_content.splitlines() if len(parts := line.split()) >= 2}
 
 
-def verify_ytdlp_sha256(file_path: Path, download_url: str) -> bool:
+def verify_ytdlp_sha256(
+    file_path: Path,
+    download_url: str,
+    actual_hash: Optional[str] = None,
+    checksums: Optional[Dict[str, str]] = None,
+) -> bool:
     """
     Verify yt-dlp file SHA256 hash against official checksums.
 
     Args:
         file_path: Path to the downloaded yt-dlp file
         download_url: The URL used to download the file (to determine the filename)
+        actual_hash: SHA256 already computed while downloading; the file is re-read if omitted
+        checksums: Checksums already fetched for this download; downloaded if omitted
 
     Returns:
         bool: True if verification successful, False otherwise
     """
     try:
-        logger.info(f"Downloading SHA256 checksums from: {YTDLP_SHA256_URL}")
-        try:
-            response = requests.get(YTDLP_SHA256_URL, timeout=10)
-            response.raise_for_status()
-            checksum_content = response.text
-        except requests.RequestException as exc:
-            logger.warning(f"Failed to download checksums via requests: {exc}")
+        if checksums is None:
             try:
-                checksum_content = _download_text_with_curl(YTDLP_SHA256_URL, timeout=30)
-            except Exception as curl_exc:
-                logger.error(f"Failed to download checksums via curl: {curl_exc}")
+                checksums = _load_checksums(YTDLP_SHA256_URL)
+            except Exception as exc:
+                logger.error(f"Failed to download checksums via curl: {exc}")
                 return False
 
         filename = download_url.split("/")[-1]
         logger.info(f"Looking for checksum for file: {filename}")
-
-        expected_hash = None
-        for line in checksum_content.strip().split("\n"):
-            if filename in line:
-                parts = line.strip().split()
-                if len(parts) >= 2 and parts[1] == filename:
-                    expected_hash = parts[0]
-                    break
+        expected_hash = checksums.get(filename)
 
         if not expected_hash:
             logger.error(f"Could not find SHA256 hash for {filename} in checksums file")
             return False
 
-        logger.info("Calculating SHA256 hash of downloaded file...")
-        actual_hash = get_file_sha256(file_path)
+        if actual_hash is None:
+            logger.info("Calculating SHA256 hash of downloaded file...")
+            actual_hash = get_file_sha256(file_path)
 
         if actual_hash.lower() == expected_hash.lower():
             logger.info("SHA256 verification successful")
@@ -111,35 +162,63 @@ def verify_ytdlp_sha256(file_path: Path, download_url: str) -> bool:
 
 def download_ytdlp(progress_callback: Optional[Callable[[int], None]] = None) -> Path:
     """Download yt-dlp binary into the app bin directory with optional progress callbacks."""
+    global _resolved_ytdlp_path
+    try:
+        return _download_ytdlp(progress_callback)
+    finally:
+        # The binary was replaced or removed either way; resolve it again on next use.
+        _resolved_ytdlp_path = None
+
+
+def _download_ytdlp(progress_callback: Optional[Callable[[int], None]]) -> Path:
     exe_path = YTDLP_APP_BIN_PATH
+    actual_hash: Optional[str] = None
+    checksums: Optional[Dict[str, str]] = None
     logger.info(f"Downloading yt-dlp from: {YTDLP_DOWNLOAD_URL}")
 
+    with ThreadPoolExecutor(max_workers=1) as checksum_pool:
+        # Fetch the checksum list while the binary downloads; the ETag file cache keeps it cheap.
+        checksums_future = checksum_pool.submit(_load_checksums, YTDLP_SHA256_URL)
+        try:
+            response = requests.get(YTDLP_DOWNLOAD_URL, stream=True, timeout=30)
+            response.raise_for_status()
+            total_size = int(response.headers.get("content-length", 0))
+            block_size = 256 * 1024
+
+            if total_size == 0 and progress_callback:
+                progress_callback(100)
+
+            hasher = hashlib.sha256()
+            report_progress = total_size > 0 and progress_callback is not None
+            with open(exe_path, "wb", buffering=1 << 20) as f:
+                downloaded = 0
+                last_percent = -1
+                for data in response.iter_content(block_size):
+                    f.write(data)
+                    hasher.update(data)
+                    if report_progress:
+                        downloaded += len(data)
+                        percent = downloaded * 100 // total_size
+                        if percent != last_percent:
+                            progress_callback(percent)
+                            last_percent = percent
+            actual_hash = hasher.hexdigest()
+        except requests.RequestException as exc:
+            logger.warning(f"Failed to download yt-dlp via requests: {exc}")
+            if exe_path.exists():
+                exe_path.unlink()
+            _download_file_with_curl(YTDLP_DOWNLOAD_URL, exe_path, timeout=120)
+            if progress_callback:
+                progress_callback(100)
+
     try:
-        response = requests.get(YTDLP_DOWNLOAD_URL, stream=True, timeout=30)
-        response.raise_for_status()
-        total_size = int(response.headers.get("content-length", 0))
-        block_size = 1024
-
-        if total_size == 0 and progress_callback:
-            progress_callback(100)
-
-        with open(exe_path, "wb") as f:
-            downloaded = 0
-            for data in response.iter_content(block_size):
-                f.write(data)
-                downloaded += len(data)
-                if total_size > 0 and progress_callback:
-                    progress_callback(int(downloaded / total_size * 100))
-    except requests.RequestException as exc:
-        logger.warning(f"Failed to download yt-dlp via requests: {exc}")
-        if exe_path.exists():
-            exe_path.unlink()
-        _download_file_with_curl(YTDLP_DOWNLOAD_URL, exe_path, timeout=120)
-        if progress_callback:
-            progress_callback(100)
+        checksums = checksums_future.result()
+    except Exception as exc:
+        # verify_ytdlp_sha256 fetches the list again and reports the failure.
+        logger.warning(f"Prefetching checksums failed: {exc}")
 
     logger.info("Download complete, verifying SHA256 hash...")
-    if not verify_ytdlp_sha256(exe_path, YTDLP_DOWNLOAD_URL):
+    if not verify_ytdlp_sha256(exe_path, YTDLP_DOWNLOAD_URL, actual_hash, checksums):
         logger.error("SHA256 verification failed, removing downloaded file")
         if exe_path.exists():
             exe_path.unlink()
@@ -153,7 +232,10 @@ def download_ytdlp(progress_callback: Optional[Callable[[int], None]] = None) ->
 
 
 def check_ytdlp_binary() -> Optional[Path]:
-    """Check if yt-dlp binary exists in the app's bin directory."""
+    """Check if yt-dlp binary exists in the app's bin directory (a hit is cached until download_ytdlp)."""
+    global _resolved_ytdlp_path
+    if _resolved_ytdlp_path is not None:
+        return _resolved_ytdlp_path
     exe_path = YTDLP_APP_BIN_PATH
     if exe_path.exists():
         if OS_NAME != "Windows" and not os.access(exe_path, os.X_OK):
@@ -163,34 +245,36 @@ def check_ytdlp_binary() -> Optional[Path]:
             except Exception as e:
                 logger.exception(f"Could not set executable permissions on {exe_path}: {e}")
         logger.info(f"Found yt-dlp in app bin directory: {exe_path}")
+        _resolved_ytdlp_path = exe_path
         return exe_path
 
     logger.warning(f"yt-dlp binary not found in app bin directory: {exe_path}")
     return None
 
 
+@lru_cache(maxsize=8)
+def _probe_version(path_str: str, mtime_ns: int) -> str:
+    """Run '<binary> --version'; only successful probes are cached, keyed on the binary's mtime."""
+    result = subprocess.run(
+        [path_str, "--version"],
+        capture_output=True,
+        text=True,
+        timeout=5,
+        creationflags=SUBPROCESS_CREATIONFLAGS,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{path_str} --version exited with {result.returncode}")
+    return result.stdout.strip()
+
+
 def check_ytdlp_installed() -> bool:
     """Check if yt-dlp is installed and accessible."""
     try:
-        ytdlp_path = check_ytdlp_binary()
-        if ytdlp_path:
-            result = subprocess.run(
-                [str(ytdlp_path), "--version"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-                creationflags=SUBPROCESS_CREATIONFLAGS,
-            )
-            return result.returncode == 0
-        # Fallback: check system PATH
-        result = subprocess.run(
-            ["yt-dlp", "--version"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            creationflags=SUBPROCESS_CREATIONFLAGS,
-        )
-        return result.returncode == 0
+        ytdlp_path = check_ytdlp_binary() or shutil.which("yt-dlp")  # fall back to system PATH
+        if not ytdlp_path:
+            return False
+        _probe_version(str(ytdlp_path), os.stat(ytdlp_path).st_mtime_ns)
+        return True
     except Exception:
         return False
 
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-import inspect
+import math
+import mmap
+import os
+import re
 import subprocess
 import threading
 import time
@@ -14,6 +17,14 @@ from src.utils.ytsage_logger import logger
 
 DEFAULT_COOKIE_DOMAINS = ("youtube.com", "google.com", "googlevideo.com")
 _REFRESH_LOCK = threading.Lock()
+# Scan results keyed by (path, mtime_ns, size, domains) so an unchanged cookie file is read only once.
+_COOKIE_SCAN_CACHE: dict[tuple, tuple[bool, float]] = {}
+_LOADER_PROFILE_KWARGS: dict[str, Optional[str]] = {}
+# Netscape cookie line: domain, flag, path, secure, expiry, name, value; captures domain and expiry.
+_COOKIE_LINE_RE = re.compile(
+    rb"^[ ]*(?!#)([^\t\r\n]+)\t[^\t\r\n]*\t[^\t\r\n]*\t[^\t\r\n]*\t([^\t\r\n]*)\t[^\t\r\n]*\t",
+    re.MULTILINE,
+)
 
 
 @dataclass(frozen=True)
@@ -37,53 +48,39 @@ def parse_browser_option(value: Optional[str]) -> tuple[Optional[str], Optional[
     return raw.lower(), None
 
 
-def _normalize_domain(domain: str) -> str:
-    domain = domain.strip()
-    if domain.startswith("#HttpOnly_"):
-        domain = domain[len("#HttpOnly_") :]
-    domain = domain.lstrip(".")
-    return domain.lower()
+def _compile_suffix_matcher(domain_suffixes: Iterable[str]) -> re.Pattern[str]:
+    # Matches a domain equal to or under any suffix, ignoring case, leading dots and the #HttpOnly_ prefix.
+    alternatives = "|".join(re.escape(suffix.strip().lstrip(".").lower()) for suffix in domain_suffixes)
+    return re.compile(rf"(?:^(?:#HttpOnly_)?|\.)(?:{alternatives})\Z", re.IGNORECASE)
 
 
-def _domain_matches(domain: str, domain_suffixes: Iterable[str]) -> bool:
-    normalized = _normalize_domain(domain)
-    for suffix in domain_suffixes:
-        suffix_norm = suffix.lstrip(".").lower()
-        if normalized == suffix_norm or normalized.endswith(f".{suffix_norm}"):
-            return True
-    return False
-
-
-def _cookie_file_has_valid_entries(
+def _scan_cookie_file(
     cookie_file: Path,
     domain_suffixes: Iterable[str],
     now_ts: int,
-) -> tuple[bool, bool]:
+) -> tuple[bool, float]:
+    # valid_until is when the last still-valid relevant cookie expires (inf for session cookies), else 0.
     has_relevant = False
-    has_valid = False
-    try:
-        with cookie_file.open("r", encoding="utf-8") as handle:
-            for line in handle:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                parts = line.split("\t")
-                if len(parts) < 7:
-                    continue
-                domain = parts[0]
-                if domain_suffixes and not _domain_matches(domain, domain_suffixes):
+    valid_until: float = 0
+    matcher = _compile_suffix_matcher(domain_suffixes) if domain_suffixes else None
+    with cookie_file.open("rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return False, 0
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in _COOKIE_LINE_RE.finditer(data):
+                domain, expiry_field = match.groups()
+                if matcher and not matcher.search(domain.decode("utf-8", "replace")):
                     continue
                 has_relevant = True
                 try:
-                    expiry = int(parts[4])
+                    expiry = int(expiry_field)
                 except ValueError:
                     continue
-                if expiry == 0 or expiry > now_ts:
-                    has_valid = True
-                    break
-    except Exception as exc:
-        logger.warning(f"Failed to read cookies from {cookie_file}: {exc}")
-    return has_relevant, has_valid
+                if expiry == 0:
+                    return True, math.inf
+                if expiry > now_ts and expiry > valid_until:
+                    valid_until = expiry
+    return has_relevant, valid_until
 
 
 def is_cookie_file_expired(
@@ -91,21 +88,33 @@ def is_cookie_file_expired(
     max_age_seconds: Optional[int] = None,
     domain_suffixes: Iterable[str] = DEFAULT_COOKIE_DOMAINS,
 ) -> bool:
-    if not cookie_file.exists():
+    try:
+        stat = cookie_file.stat()
+    except FileNotFoundError:
         return True
-    if max_age_seconds is not None:
+    except OSError as exc:
+        logger.warning(f"Failed to stat cookie file {cookie_file}: {exc}")
+        return False
+    now = time.time()
+    if max_age_seconds is not None and now - stat.st_mtime > max_age_seconds:
+        return True
+
+    domain_suffixes = tuple(domain_suffixes)
+    cache_key = (str(cookie_file), stat.st_mtime_ns, stat.st_size, domain_suffixes)
+    scan = _COOKIE_SCAN_CACHE.get(cache_key)
+    if scan is None:
         try:
-            age_seconds = time.time() - cookie_file.stat().st_mtime
-            if age_seconds > max_age_seconds:
-                return True
-        except OSError as exc:
-            logger.warning(f"Failed to stat cookie file {cookie_file}: {exc}")
-            return False
-    now_ts = int(time.time())
-    has_relevant, has_valid = _cookie_file_has_valid_entries(cookie_file, domain_suffixes, now_ts)
+            scan = _scan_cookie_file(cookie_file, domain_suffixes, int(now))
+        except Exception as exc:
+            logger.warning(f"Failed to read cookies from {cookie_file}: {exc}")
+            return True
+        if len(_COOKIE_SCAN_CACHE) >= 16:
+            _COOKIE_SCAN_CACHE.clear()
+        _COOKIE_SCAN_CACHE[cache_key] = scan
+    has_relevant, valid_until = scan
     if not has_relevant:
         return True
-    return not has_valid
+    return valid_until <= now
 
 
 def _format_refresh_command(command: str, cookie_file: Path, browser: Optional[str], profile: Optional[str]) -> str:
@@ -146,6 +155,33 @@ def _run_refresh_command(command: str, cookie_file: Path, browser: Optional[str]
     return CookieRefreshResult(refreshed=False, reason="command", error="Command finished but cookie file is empty")
 
 
+def _profile_kwarg(browser: str, loader: Callable) -> Optional[str]:
+    # browser_cookie3 names the profile argument differently across versions; look it up once per browser.
+    if browser not in _LOADER_PROFILE_KWARGS:
+        code = getattr(loader, "__code__", None)
+        names = code.co_varnames[: code.co_argcount + code.co_kwonlyargcount] if code else ()
+        _LOADER_PROFILE_KWARGS[browser] = next((name for name in ("profile", "profile_name") if name in names), None)
+    return _LOADER_PROFILE_KWARGS[browser]
+
+
+def _save_jar_if_changed(jar: MozillaCookieJar, cookie_file: Path) -> None:
+    # Save next to the target and only swap it in when the content differs; an unchanged
+    # export just bumps the mtime so max-age checks still see a fresh refresh.
+    temp_file = cookie_file.with_name(f".{cookie_file.name}.{os.getpid()}.tmp")
+    try:
+        jar.save(str(temp_file), ignore_discard=True, ignore_expires=True)
+        try:
+            unchanged = cookie_file.read_bytes() == temp_file.read_bytes()
+        except FileNotFoundError:
+            unchanged = False
+        if unchanged:
+            os.utime(cookie_file)
+        else:
+            os.replace(temp_file, cookie_file)
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+
 def _export_cookies_from_browser(
     cookie_file: Path,
     browser: str,
@@ -170,15 +206,10 @@ def _export_cookies_from_browser(
         )
 
     kwargs = {}
-    try:
-        signature = inspect.signature(loader)
-        if profile:
-            if "profile" in signature.parameters:
-                kwargs["profile"] = profile
-            elif "profile_name" in signature.parameters:
-                kwargs["profile_name"] = profile
-    except Exception:
-        pass
+    if profile:
+        profile_kwarg = _profile_kwarg(browser, loader)
+        if profile_kwarg:
+            kwargs[profile_kwarg] = profile
 
     try:
         jar = loader(**kwargs)
@@ -188,13 +219,14 @@ def _export_cookies_from_browser(
     cookie_file.parent.mkdir(parents=True, exist_ok=True)
     mozilla_jar = MozillaCookieJar(str(cookie_file))
     kept = 0
+    matcher = _compile_suffix_matcher(domain_suffixes) if domain_suffixes else None
     for cookie in jar:
-        if domain_suffixes and not _domain_matches(cookie.domain, domain_suffixes):
+        if matcher and not matcher.search(cookie.domain.strip()):
             continue
         mozilla_jar.set_cookie(cookie)
         kept += 1
     try:
-        mozilla_jar.save(ignore_discard=True, ignore_expires=True)
+        _save_jar_if_changed(mozilla_jar, cookie_file)
     except Exception as exc:
         return CookieRefreshResult(refreshed=False, reason="browser", error=str(exc))
 